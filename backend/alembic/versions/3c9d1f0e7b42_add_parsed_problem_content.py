@@ -0,0 +1,34 @@
+"""Add pre-parsed problem content
+
+Revision ID: 3c9d1f0e7b42
+Revises: a17e94b72cc1
+Create Date: 2026-10-18 10:12:41.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9d1f0e7b42'
+down_revision: Union[str, Sequence[str], None] = 'a17e94b72cc1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('problems', sa.Column('parsed_content', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('problems', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('problems', sa.Column('parser_version', sa.Integer(), nullable=True))
+    # Existing problems keep NULL here until backfill_parsed_problems.py runs;
+    # until then they are parsed from the problem store on read.
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('problems', 'parser_version')
+    op.drop_column('problems', 'content_hash')
+    op.drop_column('problems', 'parsed_content')
@@ -0,0 +1,46 @@
+"""Problem listing filters and pagination indexes
+
+Revision ID: 8e4b6a2d19f5
+Revises: 3c9d1f0e7b42
+Create Date: 2026-10-18 11:03:27.541962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4b6a2d19f5'
+down_revision: Union[str, Sequence[str], None] = '3c9d1f0e7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # GIN indexes need JSONB; plain JSON has no containment operator
+    op.alter_column('problems', 'tags',
+                    type_=postgresql.JSONB(astext_type=sa.Text()),
+                    existing_type=postgresql.JSON(astext_type=sa.Text()),
+                    existing_nullable=True,
+                    postgresql_using='tags::jsonb')
+    op.create_index('ix_problems_tags', 'problems', ['tags'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'tags': 'jsonb_path_ops'})
+    op.create_index(op.f('ix_problems_difficulty'), 'problems', ['difficulty'], unique=False)
+    op.create_index(op.f('ix_problems_author'), 'problems', ['author'], unique=False)
+    op.create_index('ix_problems_created_at_problem_id', 'problems', ['created_at', 'problem_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_problems_created_at_problem_id', table_name='problems')
+    op.drop_index(op.f('ix_problems_author'), table_name='problems')
+    op.drop_index(op.f('ix_problems_difficulty'), table_name='problems')
+    op.drop_index('ix_problems_tags', table_name='problems')
+    op.alter_column('problems', 'tags',
+                    type_=postgresql.JSON(astext_type=sa.Text()),
+                    existing_type=postgresql.JSONB(astext_type=sa.Text()),
+                    existing_nullable=True,
+                    postgresql_using='tags::json')
@@ -0,0 +1,71 @@
+"""Foreign key and access path indexes for the session tables
+
+Revision ID: b6d0e4a93c75
+Revises: 5f2a7c8e3d61
+Create Date: 2026-10-18 16:12:40.208133
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d0e4a93c75'
+down_revision: Union[str, Sequence[str], None] = '5f2a7c8e3d61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, extra create_index kwargs). Foreign keys lead, the
+# time column they are read in order of follows.
+NEW_INDEXES = [
+    ('ix_session_messages_session_id_timestamp', 'session_messages', ['session_id', 'timestamp'], {}),
+    # Append-only time column: a BRIN index is a few pages for any table size.
+    # Page ranges filled after the build are only used once summarized.
+    ('ix_session_messages_timestamp', 'session_messages', ['timestamp'],
+     {'postgresql_using': 'brin', 'postgresql_with': {'autosummarize': 'on'}}),
+    ('ix_sessions_user_id_start_time', 'sessions', ['user_id', 'start_time'], {}),
+    ('ix_sessions_problem_id_start_time', 'sessions', ['problem_id', 'start_time'], {}),
+    ('ix_attempts_session_id_submitted_at', 'attempts', ['session_id', 'submitted_at'], {}),
+    ('ix_attempts_triggering_message_id', 'attempts', ['triggering_message_id'], {}),
+    ('ix_test_case_results_attempt_id', 'test_case_results', ['attempt_id'], {}),
+    ('ix_test_case_results_test_case_id', 'test_case_results', ['test_case_id'], {}),
+    ('ix_milestones_problem_id', 'milestones', ['problem_id'], {}),
+    ('ix_test_cases_problem_id', 'test_cases', ['problem_id'], {}),
+    ('ix_milestone_requirements_test_case_id', 'milestone_requirements', ['test_case_id'], {}),
+]
+
+# Plain indexes on primary key columns, which the primary key already indexes
+REDUNDANT_PK_INDEXES = [
+    ('ix_users_user_id', 'users', ['user_id']),
+    ('ix_problems_problem_id', 'problems', ['problem_id']),
+    ('ix_milestones_milestone_id', 'milestones', ['milestone_id']),
+    ('ix_test_cases_test_case_id', 'test_cases', ['test_case_id']),
+    ('ix_sessions_session_id', 'sessions', ['session_id']),
+    ('ix_session_messages_message_id', 'session_messages', ['message_id']),
+    ('ix_attempts_attempt_id', 'attempts', ['attempt_id']),
+    ('ix_test_case_results_result_id', 'test_case_results', ['result_id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction, and does not block writes
+    # while the index builds. If a build fails it leaves an INVALID index
+    # behind: drop it by hand before running the migration again.
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in NEW_INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True, **kwargs)
+        for name, table, _ in REDUNDANT_PK_INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in REDUNDANT_PK_INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+        for name, table, _, _ in reversed(NEW_INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,137 @@
+"""Partition session_messages by month of timestamp
+
+Revision ID: d3a81f6c5b20
+Revises: b6d0e4a93c75
+Create Date: 2026-10-18 18:41:05.527316
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a81f6c5b20'
+down_revision: Union[str, Sequence[str], None] = 'b6d0e4a93c75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+message_type_enum = postgresql.ENUM(
+    'CHAT', 'CODE', 'OUTPUT', name='messagetype', create_type=False
+)
+
+# Monthly partitions created past the current month. From then on the app
+# keeps them created ahead (app/utils/message_partitions.py).
+MONTHS_AHEAD = 3
+
+COLUMNS = 'message_id, session_id, sender, content, "timestamp", message_type'
+
+
+def _month(moment: datetime, offset: int = 0) -> datetime:
+    moment = moment.astimezone(timezone.utc)
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _create_message_indexes(table: str) -> None:
+    op.create_index('ix_session_messages_session_id_timestamp', table, ['session_id', 'timestamp'], unique=False)
+    op.create_index('ix_session_messages_timestamp', table, ['timestamp'], unique=False,
+                    postgresql_using='brin', postgresql_with={'autosummarize': 'on'})
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The messages are copied into the new table in this transaction, which
+    # blocks writes to session_messages until it commits: run it before the
+    # table grows large.
+    op.drop_constraint('attempts_triggering_message_id_fkey', 'attempts', type_='foreignkey')
+
+    op.rename_table('session_messages', 'session_messages_unpartitioned')
+    op.execute('ALTER INDEX session_messages_pkey RENAME TO session_messages_unpartitioned_pkey')
+    op.execute('ALTER TABLE session_messages_unpartitioned RENAME CONSTRAINT session_messages_session_id_fkey '
+               'TO session_messages_unpartitioned_session_id_fkey')
+    op.drop_index('ix_session_messages_session_id_timestamp', table_name='session_messages_unpartitioned')
+    op.drop_index('ix_session_messages_timestamp', table_name='session_messages_unpartitioned')
+
+    op.create_table('session_messages',
+    sa.Column('message_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('session_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('sender', sa.String(), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('message_type', message_type_enum, nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.session_id'], name='session_messages_session_id_fkey'),
+    sa.PrimaryKeyConstraint('message_id', 'timestamp'),
+    postgresql_partition_by='RANGE (timestamp)',
+    )
+    # Indexes on the parent are created on every partition, present and future
+    _create_message_indexes('session_messages')
+
+    # One partition per month from the oldest message on, plus a default one
+    # that catches messages of months without a partition
+    oldest = op.get_bind().execute(sa.text(
+        'SELECT min("timestamp") FROM session_messages_unpartitioned'
+    )).scalar()
+    now = datetime.now(timezone.utc)
+    month = _month(oldest or now)
+    last = _month(now, MONTHS_AHEAD)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE session_messages_p{month:%Y_%m} PARTITION OF session_messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_month(month, 1).isoformat()}')"
+        )
+        month = _month(month, 1)
+    op.execute('CREATE TABLE session_messages_default PARTITION OF session_messages DEFAULT')
+
+    # timestamp is now part of the primary key; messages without one get
+    # their session's start time
+    op.execute(
+        f'INSERT INTO session_messages ({COLUMNS}) '
+        'SELECT m.message_id, m.session_id, m.sender, m.content, '
+        'COALESCE(m."timestamp", s.start_time, now()), m.message_type '
+        'FROM session_messages_unpartitioned AS m LEFT JOIN sessions AS s ON s.session_id = m.session_id '
+        'ORDER BY 5'
+    )
+    op.drop_table('session_messages_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Partitions detached by the retention job are left alone (plain tables).
+    # The attached partitions keep their own session_messages_session_id_fkey
+    # until dropped, so the new table names its foreign key explicitly.
+    op.rename_table('session_messages', 'session_messages_partitioned')
+    op.execute('ALTER INDEX session_messages_pkey RENAME TO session_messages_partitioned_pkey')
+    op.execute('ALTER TABLE session_messages_partitioned RENAME CONSTRAINT session_messages_session_id_fkey '
+               'TO session_messages_partitioned_session_id_fkey')
+    op.drop_index('ix_session_messages_session_id_timestamp', table_name='session_messages_partitioned')
+    op.drop_index('ix_session_messages_timestamp', table_name='session_messages_partitioned')
+
+    op.create_table('session_messages',
+    sa.Column('message_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('session_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('sender', sa.String(), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('message_type', message_type_enum, nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.session_id'], name='session_messages_session_id_fkey'),
+    sa.PrimaryKeyConstraint('message_id')
+    )
+    op.execute(
+        f'INSERT INTO session_messages ({COLUMNS}) '
+        f'SELECT {COLUMNS} FROM session_messages_partitioned ORDER BY "timestamp"'
+    )
+    _create_message_indexes('session_messages')
+    # Drops the partitions with it
+    op.drop_table('session_messages_partitioned')
+
+    # Attempts pointing at messages that were detached cannot keep their link
+    op.execute(
+        'UPDATE attempts SET triggering_message_id = NULL WHERE triggering_message_id IS NOT NULL '
+        'AND triggering_message_id NOT IN (SELECT message_id FROM session_messages)'
+    )
+    op.create_foreign_key('attempts_triggering_message_id_fkey', 'attempts', 'session_messages',
+                          ['triggering_message_id'], ['message_id'])
@@ -11,6 +11,8 @@ ALGORITHMS = ["RS256"]
 
 # This tells FastAPI where to look for the token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Same, for endpoints where the token is only needed for some requests
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 # Fetch the Auth0 public keys (JWKS)
 # This is done once when the app starts
@@ -1,6 +1,24 @@
+import base64
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from sqlalchemy import and_, func, literal_column, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from . import models, schemas
 
+# Columns the problem selection page needs. Everything else (file_path,
+# update_log, parsed_content...) is only loaded by the full listing.
+PROBLEM_SUMMARY_COLUMNS = (
+    models.Problem.problem_id,
+    models.Problem.title,
+    models.Problem.description,
+    models.Problem.difficulty,
+    models.Problem.author,
+    models.Problem.tags,
+    models.Problem.created_at,
+)
+
 def get_user(db: Session, user_id: str):
     """
     Retrieve a user by their unique user_id (Auth0 sub).
@@ -19,4 +37,222 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+def _upsert_user_statement(user: schemas.UserCreate):
+    statement = insert(models.User).values(user_id=user.user_id, email=user.email, name=user.name)
+    # Setting email to its own value leaves an existing row as it was (like
+    # get_user would return it) but, unlike DO NOTHING, lets RETURNING yield it.
+    return statement.on_conflict_do_update(
+        index_elements=[models.User.user_id],
+        set_={"email": models.User.email},
+    ).returning(*models.User.__table__.c)
+
+async def upsert_user_async(db: AsyncSession, user: schemas.UserCreate):
+    """
+    Returns the user, creating it first if needed, in a single
+    INSERT ... ON CONFLICT (user_id) DO UPDATE ... RETURNING round trip.
+    Concurrent calls for the same user_id cannot race into an IntegrityError.
+    """
+    row = (await db.execute(_upsert_user_statement(user))).one()
+    await db.commit()
+    return row
+
+def encode_problem_cursor(created_at: datetime, problem_id: UUID) -> str:
+    """
+    Opaque cursor pointing at the last problem of a page.
+    """
+    raw = f"{created_at.isoformat()}|{problem_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_problem_cursor(cursor: str):
+    """
+    Inverse of encode_problem_cursor. Raises ValueError on a malformed cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, problem_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(problem_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _list_problems_statement(summary, difficulty, tag, author, cursor, limit):
+    """
+    The SELECT behind list_problems_async.
+    """
+    if summary:
+        statement = select(*PROBLEM_SUMMARY_COLUMNS)
+    else:
+        statement = select(models.Problem)
+
+    if difficulty:
+        statement = statement.where(models.Problem.difficulty == difficulty)
+    if author:
+        statement = statement.where(models.Problem.author == author)
+    if tag:
+        # JSONB containment (@>), served by the GIN index on tags
+        statement = statement.where(models.Problem.tags.contains([tag]))
+    if cursor:
+        created_at, problem_id = decode_problem_cursor(cursor)
+        statement = statement.where(
+            tuple_(models.Problem.created_at, models.Problem.problem_id) > tuple_(created_at, problem_id)
+        )
+
+    statement = statement.order_by(models.Problem.created_at, models.Problem.problem_id)
+    if limit is not None:
+        # Fetch one extra row to know whether there is a next page
+        statement = statement.limit(limit + 1)
+    return statement
+
+def _problems_page(rows, limit):
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_problem_cursor(rows[-1].created_at, rows[-1].problem_id)
+
+async def list_problems_async(
+    db: AsyncSession,
+    summary: bool = False,
+    difficulty: str = None,
+    tag: str = None,
+    author: str = None,
+    cursor: str = None,
+    limit: int = None,
+):
+    """
+    Lists problems ordered by (created_at, problem_id), optionally filtered.
+
+    With a limit, returns at most that many rows plus the cursor of the next
+    page (None on the last page). Without one, returns every matching row.
+    The summary projection only selects PROBLEM_SUMMARY_COLUMNS.
+    Returns a (rows, next_cursor) tuple.
+    """
+    result = await db.execute(_list_problems_statement(summary, difficulty, tag, author, cursor, limit))
+    rows = result.all() if summary else result.scalars().all()
+    return _problems_page(rows, limit)
+
+async def get_problem_async(db: AsyncSession, problem_id: UUID):
+    """
+    Retrieve a problem row by its problem_id.
+    """
+    return await db.scalar(select(models.Problem).where(models.Problem.problem_id == problem_id))
+
+async def get_catalog_version_async(db: AsyncSession) -> int:
+    """
+    Current catalog version (a single primary-key lookup).
+    """
+    return await db.scalar(select(models.CatalogVersion.version).where(models.CatalogVersion.id == 1)) or 0
+
+def bump_catalog_version(db: Session) -> int:
+    """
+    Increments the catalog version inside the caller's transaction, so it
+    only becomes visible to other workers when the upload commits.
+    """
+    return db.execute(
+        update(models.CatalogVersion)
+        .where(models.CatalogVersion.id == 1)
+        .values(version=models.CatalogVersion.version + 1)
+        .returning(models.CatalogVersion.version)
+    ).scalar()
+
+# ==============================================================================
+# Sessions & Session Messages
+# ==============================================================================
+
+# Conversation event "type" <-> SessionMessage.message_type
+EVENT_TYPE_TO_MESSAGE_TYPE = {
+    "chat": models.MessageType.CHAT,
+    "code": models.MessageType.CODE,
+    "output": models.MessageType.OUTPUT,
+}
+
+# Messages are stamped by the app's clock and sessions by the database's;
+# margin for the skew between the two when bounding messages by start_time
+SESSION_MESSAGE_CLOCK_SKEW = timedelta(days=1)
+
+async def create_session_async(db: AsyncSession, user_id: str, problem_id: UUID):
+    """
+    Starts a new session for a user working on a problem.
+    """
+    db_session = models.Session(user_id=user_id, problem_id=problem_id)
+    db.add(db_session)
+    await db.commit()
+    await db.refresh(db_session)
+    return db_session
+
+async def get_session_async(db: AsyncSession, session_id: UUID):
+    return await db.scalar(select(models.Session).where(models.Session.session_id == session_id))
+
+def _session_messages_filter(session_id: UUID):
+    """
+    Selects a session's messages. Bounding timestamp between the session's
+    start and now lets PostgreSQL skip, at run time, the session_messages
+    partitions of earlier months and the ones created ahead, instead of
+    probing every month's index.
+    """
+    started = (
+        select(func.coalesce(models.Session.start_time - SESSION_MESSAGE_CLOCK_SKEW,
+                             literal_column("'-infinity'::timestamptz")))
+        .where(models.Session.session_id == session_id)
+        .scalar_subquery()
+    )
+    return and_(
+        models.SessionMessage.session_id == session_id,
+        models.SessionMessage.timestamp >= started,
+        models.SessionMessage.timestamp < func.now() + SESSION_MESSAGE_CLOCK_SKEW,
+    )
+
+async def latest_session_message_async(db: AsyncSession, session_id: UUID):
+    """
+    Timestamp of a session's newest stored message, or None. Reads a single
+    entry of the (session_id, timestamp) index.
+    """
+    return await db.scalar(
+        select(models.SessionMessage.timestamp)
+        .where(_session_messages_filter(session_id))
+        .order_by(models.SessionMessage.timestamp.desc())
+        .limit(1)
+    )
+
+def _session_messages_statement(session_id: UUID):
+    return (
+        select(models.SessionMessage.message_id, models.SessionMessage.sender,
+               models.SessionMessage.message_type, models.SessionMessage.content,
+               models.SessionMessage.timestamp)
+        .where(_session_messages_filter(session_id))
+        .order_by(models.SessionMessage.timestamp)
+    )
+
+async def get_session_messages_async(db: AsyncSession, session_id: UUID) -> list:
+    """
+    A session's stored messages in order, as (message_id, sender,
+    message_type, content, timestamp) rows.
+    """
+    return (await db.execute(_session_messages_statement(session_id))).all()
+
+def as_events(messages) -> list:
+    """
+    Rebuilds a conversation_history (chronological list of
+    {"author", "type", "content"} events) from get_session_messages_async rows.
+    """
+    return [
+        {"author": sender, "type": message_type.value.lower(), "content": content}
+        for _message_id, sender, message_type, content, _timestamp in messages
+    ]
+
+def session_message_rows(session_id: UUID, events: list) -> list:
+    """
+    Converts conversation events into session_messages rows. Timestamps are
+    set here, one microsecond apart, so events stored together keep their order.
+    """
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "session_id": session_id,
+            "sender": event.get("author"),
+            "content": event.get("content", ""),
+            "message_type": EVENT_TYPE_TO_MESSAGE_TYPE.get(event.get("type"), models.MessageType.CHAT),
+            "timestamp": now + timedelta(microseconds=index),
+        }
+        for index, event in enumerate(events)
+    ]
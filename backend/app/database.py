@@ -1,9 +1,14 @@
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from . import metrics
+
 # --- START OF PRODUCTION-READY CONFIG ---
 # 1. Get database credentials from environment variables
 DB_USER = os.getenv("POSTGRES_USER")
@@ -19,6 +24,8 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 # 3. Build the database URL
 #    postgresql://<user>:<password>@<host>:<port>/<dbname>
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Same database through asyncpg, for the async session
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # --- END OF PRODUCTION-READY CONFIG ---
 
@@ -30,10 +37,133 @@ DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NA
 # # Create the SQLAlchemy engine
 # engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+# Connection pools. Each gunicorn worker has a sync and an async pool, so the
+# database (through cloud-sql-proxy) sees up to workers * (DB_POOL_SIZE +
+# DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW) connections;
+# keep that under the Cloud SQL connection limit.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this, before the proxy drops them as idle
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout so a dropped one is replaced, not an error
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side limit per statement, in milliseconds (0 = none)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# Minimum seconds between two pool exhaustion warnings
+DB_POOL_WARNING_INTERVAL_SECONDS = 60
+
+
+class _InstrumentedPool:
+    """
+    Pool mixin that reports how long checkouts wait for a connection and how
+    many connections are in use, and warns when requests start queueing
+    because every connection is taken.
+    """
+    metric_prefix = "db.pool"
+    settings_hint = "DB_POOL_SIZE / DB_MAX_OVERFLOW"
+    _last_warning = 0.0
+
+    def _do_get(self):
+        if self.checkedout() >= self.size() + max(self._max_overflow, 0):
+            metrics.increment(f"{self.metric_prefix}.exhausted")
+            now = time.monotonic()
+            if now - self._last_warning >= DB_POOL_WARNING_INTERVAL_SECONDS:
+                self._last_warning = now
+                print(f"Warning: database pool exhausted ({self.checkedout()} connections in use), "
+                      f"requests are waiting; consider raising {self.settings_hint}")
+
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe(f"{self.metric_prefix}.checkout_wait_seconds", time.perf_counter() - started)
+            self._report()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._report()
+
+    def _report(self):
+        metrics.set_gauge(f"{self.metric_prefix}.checked_out", self.checkedout())
+        metrics.set_gauge(f"{self.metric_prefix}.open", self.checkedin() + self.checkedout())
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    metric_prefix = "db.async_pool"
+    settings_hint = "DB_ASYNC_POOL_SIZE / DB_ASYNC_MAX_OVERFLOW"
+
+
+def _connect_args() -> dict:
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def _async_connect_args() -> dict:
+    # asyncpg takes server settings instead of libpq options
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return {}
+
+
+def _count_connection_churn(sync_engine, metric_prefix: str):
+    """
+    Counts connections opened, closed and invalidated (e.g. failed pre-ping).
+    """
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.increment(f"{metric_prefix}.connections_opened")
+
+    @event.listens_for(sync_engine, "close")
+    def _on_close(dbapi_connection, connection_record):
+        metrics.increment(f"{metric_prefix}.connections_closed")
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.increment(f"{metric_prefix}.connections_invalidated")
+
+
 # Create the SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
+_count_connection_churn(engine, InstrumentedQueuePool.metric_prefix)
+
+# Async engine (asyncpg) for the async endpoints, so their queries do not
+# block the event loop. It has its own pool next to the sync one, which is
+# still used by the event recorder (in a thread) and the admin upload.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=DB_ASYNC_POOL_SIZE,
+    max_overflow=DB_ASYNC_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_async_connect_args(),
+)
+_count_connection_churn(async_engine.sync_engine, InstrumentedAsyncQueuePool.metric_prefix)
+
 # Create a SessionLocal class. Each instance of a SessionLocal class will be a database session.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async counterpart. Objects stay usable after commit, since an async
+# session cannot lazily reload expired attributes.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Create a Base class. Our ORM models will inherit from this class.
 Base = declarative_base()
@@ -44,4 +174,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,61 @@
+# /backend/app/metrics.py
+import threading
+from collections import defaultdict
+
+# ==============================================================================
+# In-process metrics registry
+# ==============================================================================
+# Every gunicorn worker keeps its own counters. They are exposed through
+# GET /api/metrics (admin token required) so they can be scraped per worker
+# while we size caches, pools and queues under classroom load.
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+
+
+def increment(name: str, value: int = 1):
+    """
+    Increase a monotonically growing counter (e.g. cache hits).
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value):
+    """
+    Record the current value of something that goes up and down (e.g. queue depth).
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    """
+    Record a duration sample. Only count, total and max are kept,
+    which is enough to derive an average without storing every sample.
+    """
+    with _lock:
+        timing = _timings[name]
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+def snapshot() -> dict:
+    """
+    Returns a JSON-serialisable copy of every metric recorded by this worker.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {
+                name: {
+                    **timing,
+                    "avg": timing["total"] / timing["count"] if timing["count"] else 0.0,
+                }
+                for name, timing in _timings.items()
+            },
+        }
@@ -3,13 +3,15 @@ import enum
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     Text,
     DateTime,
     ForeignKey,
     Enum,
     Boolean,
-    Table
+    Table,
+    Index
 )
 from sqlalchemy.dialects.postgresql import JSONB, JSON, UUID
 from sqlalchemy.orm import relationship
@@ -24,7 +26,7 @@ from .database import Base
 class User(Base):
     __tablename__ = "users"
 
-    user_id = Column(String, primary_key=True, index=True) # Auth0 ID
+    user_id = Column(String, primary_key=True) # Auth0 ID
     email = Column(String, unique=True, index=True, nullable=False)
     name = Column(String)
     demographics = Column(JSONB, nullable=True)
@@ -38,18 +40,39 @@ class Problem(Base):
     problem_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True) # Short description from frontmatter
-    difficulty = Column(String)
-    author = Column(String)
+    difficulty = Column(String, index=True)
+    author = Column(String, index=True)
     file_path = Column(String, nullable=False, unique=True) # Path to markdown file in GCS
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    tags = Column(JSON, nullable=True)
+    tags = Column(JSONB, nullable=True) # JSONB so tag filters can use a GIN index
     update_log = Column(JSON, nullable=True)
+    # Output of parse_problem_content, computed once at upload time
+    parsed_content = Column(JSONB, nullable=True)
+    content_hash = Column(String(64), nullable=True) # SHA-256 of the markdown file
+    parser_version = Column(Integer, nullable=True)
 
     # Relationships
     sessions = relationship("Session", back_populates="problem")
     milestones = relationship("Milestone", back_populates="problem")
     test_cases = relationship("TestCase", back_populates="problem")
 
+    __table_args__ = (
+        Index("ix_problems_tags", "tags", postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}),
+        # Keyset pagination order used by the problem listing
+        Index("ix_problems_created_at_problem_id", "created_at", "problem_id"),
+    )
+
+
+class CatalogVersion(Base):
+    """
+    Single-row table holding a counter bumped by every problem upload.
+    Workers compare it with the version of their in-memory catalog snapshot.
+    """
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True, default=1)
+    version = Column(BigInteger, nullable=False, default=0)
+
 
 # ==============================================================================
 # Problem Structure Models
@@ -58,7 +81,9 @@ class Problem(Base):
 # Join table for many-to-many relationship between Milestones and TestCases
 milestone_requirements = Table('milestone_requirements', Base.metadata,
     Column('milestone_id', UUID(as_uuid=True), ForeignKey('milestones.milestone_id'), primary_key=True),
-    Column('test_case_id', UUID(as_uuid=True), ForeignKey('test_cases.test_case_id'), primary_key=True)
+    Column('test_case_id', UUID(as_uuid=True), ForeignKey('test_cases.test_case_id'), primary_key=True),
+    # The primary key covers lookups by milestone_id only
+    Index('ix_milestone_requirements_test_case_id', 'test_case_id'),
 )
 
 class Milestone(Base):
@@ -67,7 +92,7 @@ class Milestone(Base):
     milestone_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     description = Column(Text, nullable=False)
     order = Column(Integer, nullable=False)
-    problem_id = Column(UUID(as_uuid=True), ForeignKey("problems.problem_id"), nullable=False)
+    problem_id = Column(UUID(as_uuid=True), ForeignKey("problems.problem_id"), nullable=False, index=True)
 
     # Relationships
     problem = relationship("Problem", back_populates="milestones")
@@ -79,7 +104,7 @@ class TestCase(Base):
     test_case_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     description = Column(Text)
-    problem_id = Column(UUID(as_uuid=True), ForeignKey("problems.problem_id"), nullable=False)
+    problem_id = Column(UUID(as_uuid=True), ForeignKey("problems.problem_id"), nullable=False, index=True)
 
     # Relationships
     problem = relationship("Problem", back_populates="test_cases")
@@ -106,46 +131,77 @@ class Session(Base):
     messages = relationship("SessionMessage", back_populates="session", cascade="all, delete-orphan")
     attempts = relationship("Attempt", back_populates="session", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # A user's or a problem's sessions, in time order
+        Index("ix_sessions_user_id_start_time", "user_id", "start_time"),
+        Index("ix_sessions_problem_id_start_time", "problem_id", "start_time"),
+    )
+
 class MessageType(enum.Enum):
     CHAT = "CHAT"
     CODE = "CODE"
     OUTPUT = "OUTPUT"
 
 class SessionMessage(Base):
+    """
+    Range-partitioned by month of timestamp (see app/utils/message_partitions.py),
+    so the primary key has to include timestamp.
+    """
     __tablename__ = "session_messages"
 
     message_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.session_id"), nullable=False)
     sender = Column(String) # e.g., "user" or "agent"
     content = Column(Text)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     message_type = Column(Enum(MessageType))
 
     # Relationships
     session = relationship("Session", back_populates="messages")
-    triggered_attempt = relationship("Attempt", back_populates="triggering_message", uselist=False)
+    triggered_attempt = relationship(
+        "Attempt", back_populates="triggering_message", uselist=False,
+        primaryjoin="SessionMessage.message_id == foreign(Attempt.triggering_message_id)",
+    )
+
+    __table_args__ = (
+        # A session's messages in order (crud.get_session_messages_async)
+        Index("ix_session_messages_session_id_timestamp", "session_id", "timestamp"),
+        # Time range scans; rows arrive in timestamp order, so BRIN stays tiny.
+        # autosummarize lets autovacuum summarize new page ranges as they fill.
+        Index("ix_session_messages_timestamp", "timestamp", postgresql_using="brin",
+              postgresql_with={"autosummarize": "on"}),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
 class Attempt(Base):
     __tablename__ = "attempts"
 
     attempt_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.session_id"))
-    triggering_message_id = Column(UUID(as_uuid=True), ForeignKey("session_messages.message_id"), nullable=True)
+    # No foreign key: a partitioned session_messages cannot make message_id unique on its own
+    triggering_message_id = Column(UUID(as_uuid=True), nullable=True, index=True)
     score = Column(Integer)
     time_taken_seconds = Column(Integer)
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
     session = relationship("Session", back_populates="attempts")
-    triggering_message = relationship("SessionMessage", back_populates="triggered_attempt")
+    triggering_message = relationship(
+        "SessionMessage", back_populates="triggered_attempt",
+        primaryjoin="SessionMessage.message_id == foreign(Attempt.triggering_message_id)",
+    )
     results = relationship("TestCaseResult", back_populates="attempt", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_attempts_session_id_submitted_at", "session_id", "submitted_at"),
+    )
+
 class TestCaseResult(Base):
     __tablename__ = "test_case_results"
 
     result_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    attempt_id = Column(UUID(as_uuid=True), ForeignKey("attempts.attempt_id"))
-    test_case_id = Column(UUID(as_uuid=True), ForeignKey("test_cases.test_case_id"))
+    attempt_id = Column(UUID(as_uuid=True), ForeignKey("attempts.attempt_id"), index=True)
+    test_case_id = Column(UUID(as_uuid=True), ForeignKey("test_cases.test_case_id"), index=True)
     passed = Column(Boolean)
 
     # Relationships
@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import asyncio
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from google import genai
+
+from .. import crud, metrics
+from ..auth import optional_oauth2_scheme, validate_token
+from ..database import get_async_db
+from ..utils.session_history import session_history
+from ..utils.event_recorder import event_recorder
+from ..utils.agent_tools.conversation_view import ConversationView
+from ..utils.agent_tools.route_cache import route_cache
+from ..utils.agent_tools.llm_scheduler import llm_scheduler, LLMRejected
+from ..utils.agent_tools.llm_backends import create_llm_backend
+
+from ..utils.agent_tools.gemini_agent import (
+    get_agent_code_async,
+    get_agent_response_async,
+    stream_agent_response_async,
+    routing_agent_async,
+)
+
+# ==============================================================================
+# Router Configuration & AI Client Setup
+# ==============================================================================
+
+router = APIRouter(
+    prefix="/api",
+    tags=["Chat"]
+)
+
+client_gemini = genai.Client(api_key = os.environ.get("GEMINI_API_KEY"))
+# Provider(s) the agents call: Gemini unless LLM_BACKENDS says otherwise
+llm_backend = create_llm_backend(client_gemini)
+
+# Start the code agent at the same time as the router instead of after it.
+# Saves a router round trip on "code" turns, at the price of a discarded
+# code call on "no_code" turns.
+CHAT_SPECULATIVE_CODEGEN = os.getenv("CHAT_SPECULATIVE_CODEGEN", "false").lower() in ("1", "true", "yes")
+
+# Estimated tokens of history (plus the latest agent and user code) sent to
+# each agent. Older events are summarised or dropped to stay under it, so a
+# few long code snapshots cannot blow up prompt size. 0 (the default) turns it
+# off and only the event-count limits apply.
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "0")) or None
+
+# Show older code snapshots in the prompt history as diffs against the same
+# author's previous snapshot; the latest code is always sent in full.
+CHAT_PROMPT_CODE_DIFFS = os.getenv("CHAT_PROMPT_CODE_DIFFS", "false").lower() in ("1", "true", "yes")
+
+# Time a whole turn (queueing, retries and every agent call) may take before
+# the student gets a "busy" answer instead of waiting on.
+CHAT_TURN_DEADLINE_SECONDS = float(os.getenv("CHAT_TURN_DEADLINE_SECONDS", "120"))
+
+ROUTER_MODEL = "gemini-2.5-flash-lite"
+CODE_MODEL = "gemini-2.5-pro"
+
+# ==============================================================================
+# Helpers
+# ==============================================================================
+
+def _invalid_events(events) -> bool:
+    return not isinstance(events, list) or any(
+        not isinstance(event, dict)
+        or event.get("type") not in crud.EVENT_TYPE_TO_MESSAGE_TYPE
+        or not isinstance(event.get("author"), str)
+        or not isinstance(event.get("content", ""), str)
+        for event in events
+    )
+
+
+def _session_user(token: Optional[str]):
+    """
+    The user_id (the token's "sub" claim) a session request acts for, or a
+    JSONResponse if the bearer token is missing or invalid.
+    """
+    if token is None:
+        return JSONResponse(status_code=401, content={"error": "Sessions require a bearer token."},
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return validate_token(token)["sub"]
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.detail}, headers=e.headers)
+
+
+async def _parse_chat_request(data: dict, db: AsyncSession, token: Optional[str]):
+    """
+    Validates the chat payload and resolves the conversation history.
+
+    Two shapes are accepted:
+      - Legacy: the full `conversation_history` array on every turn.
+      - Session: a `session_id` plus only the new `events` of this turn. The
+        rest of the history is kept server-side. To start a session, send a
+        `problem_id` instead of `session_id`. Sessions belong to the user of
+        the bearer token, and only that user can continue them.
+
+    Returns (conversation, lesson_context, session_id), where conversation is a
+    ConversationView shared by every prompt of the turn and session_id is None
+    in legacy mode, or a JSONResponse describing the error. lesson_context
+    also carries the turn's scheduling settings (session_key, deadline).
+    """
+    lesson_context = {
+        "problem_statement": data.get("problem_statement", ""),
+        "lesson_goals": data.get("lesson_goals", ""),
+        "common_mistakes": data.get("common_mistakes", ""),
+        # Every LLM call of this turn must be done by then (see llm_scheduler)
+        "deadline": time.monotonic() + CHAT_TURN_DEADLINE_SECONDS,
+    }
+    # Fair queueing key; legacy requests each count as their own session
+    lesson_context["session_key"] = id(lesson_context)
+
+    # Legacy mode: receive the full history from the client
+    if "conversation_history" in data or ("session_id" not in data and "events" not in data):
+        conversation_history = data.get("conversation_history")
+        if conversation_history is None or not isinstance(conversation_history, list):
+            return JSONResponse(status_code=400, content={"error": "A 'conversation_history' array is required."})
+        return ConversationView.from_history(conversation_history), lesson_context, None
+
+    # Session mode: only the new events travel over the wire
+    user_id = _session_user(token)
+    if isinstance(user_id, JSONResponse):
+        return user_id
+
+    events = data.get("events", [])
+    if _invalid_events(events):
+        return JSONResponse(status_code=400, content={
+            "error": "'events' must be an array of {\"author\", \"type\": \"chat\" | \"code\" | \"output\", \"content\"} objects."
+        })
+
+    try:
+        if data.get("session_id"):
+            session_id = UUID(str(data["session_id"]))
+            conversation = await session_history.get_async(db, session_id, user_id)
+            if conversation is None:
+                return JSONResponse(status_code=404, content={"error": "Session not found"})
+        elif data.get("problem_id"):
+            session_id = (await crud.create_session_async(db, user_id, UUID(str(data["problem_id"])))).session_id
+            conversation = ConversationView()
+            session_history.put(session_id, conversation, user_id)
+        else:
+            return JSONResponse(status_code=400, content={"error": "Send a 'session_id', or a 'problem_id' to start a session."})
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid session_id or problem_id"})
+    except IntegrityError:
+        await db.rollback()
+        return JSONResponse(status_code=400, content={"error": "Unknown user or problem_id"})
+
+    if events:
+        session_history.recorded(session_id, await event_recorder.record(session_id, events))
+        conversation.extend(events)
+    lesson_context["session_key"] = session_id
+    return conversation, lesson_context, session_id
+
+
+async def _finish_turn(session_id, conversation, agent_code, agent_text):
+    """
+    In session mode, adds the agent's reply to the server-side history and
+    queues it for storage, so the client does not have to send it back next
+    turn. The agent's code event is already in conversation here.
+    """
+    if session_id is None:
+        return
+    reply_events = []
+    if agent_code:
+        reply_events.append({"author": "agent", "type": "code", "content": agent_code})
+    chat_event = {"author": "agent", "type": "chat", "content": agent_text}
+    reply_events.append(chat_event)
+    conversation.append(chat_event)
+    session_history.recorded(session_id, await event_recorder.record(session_id, reply_events))
+
+
+def _abort_turn(session_id):
+    """
+    After a failed turn the cached history may hold agent events that were
+    never stored; drop it so the next turn rebuilds it from the database.
+    """
+    if session_id is not None:
+        session_history.invalidate(session_id)
+
+
+# The agent calls go through the backend's async client (client.aio for
+# Gemini), so a worker can hold many in-flight LLM calls without blocking the
+# event loop. Every call is admitted
+# by llm_scheduler (per-model concurrency and rate limits, fair per-session
+# queueing, 429/503 retries and the turn's deadline).
+
+async def _route_turn(lesson_context, conversation):
+    """
+    Asks the routing agent and remembers its answer (see route_cache).
+    """
+    route = await llm_scheduler.run(
+        ROUTER_MODEL,
+        lambda: routing_agent_async(llm_backend,
+                                    conversation,
+                                    history_limit = 10,
+                                    model_name = ROUTER_MODEL,
+                                    history_token_budget = CHAT_HISTORY_TOKEN_BUDGET,
+                                    code_diffs = CHAT_PROMPT_CODE_DIFFS),
+        session_key = lesson_context["session_key"],
+        deadline = lesson_context["deadline"],
+    )
+    route_cache.store(conversation, route)
+    return route
+
+
+async def _generate_code(lesson_context, conversation):
+    return await llm_scheduler.run(
+        CODE_MODEL,
+        lambda: get_agent_code_async(llm_backend,
+                                     lesson_context["problem_statement"],
+                                     lesson_context["lesson_goals"],
+                                     lesson_context["common_mistakes"],
+                                     conversation,
+                                     notebook_content = "",
+                                     history_limit = 15,
+                                     model_name = CODE_MODEL,
+                                     thinking_budget = 128, # -1
+                                     temperature = 0.2,
+                                     history_token_budget = CHAT_HISTORY_TOKEN_BUDGET,
+                                     code_diffs = CHAT_PROMPT_CODE_DIFFS),
+        session_key = lesson_context["session_key"],
+        deadline = lesson_context["deadline"],
+    )
+
+
+async def _start_turn(lesson_context, conversation):
+    """
+    Decides the route for this turn and, on "code" turns, starts the code agent.
+
+    Returns (route, pending_code), where pending_code is a task resolving to
+    the new agent code, or None on "no_code" turns. With speculation on, the
+    code agent runs concurrently with the router and is cancelled if the route
+    comes back "no_code". Routes known without the LLM (rule table or cached
+    decision) skip both the router call and the speculation.
+    """
+    route = route_cache.lookup(conversation)
+    if route is not None or not CHAT_SPECULATIVE_CODEGEN:
+        if route is None:
+            route = await _route_turn(lesson_context, conversation)
+        if route == "code":
+            return route, asyncio.create_task(_generate_code(lesson_context, conversation))
+        return route, None
+
+    code_task = asyncio.create_task(_generate_code(lesson_context, conversation))
+    router_started = time.perf_counter()
+    try:
+        route = await _route_turn(lesson_context, conversation)
+    except Exception:
+        code_task.cancel()
+        raise
+    router_seconds = time.perf_counter() - router_started
+
+    if route == "code":
+        # The router round trip overlapped with code generation
+        metrics.increment("chat.speculative_codegen.saved")
+        metrics.observe("chat.speculative_codegen.router_seconds_hidden", router_seconds)
+        return route, code_task
+
+    code_task.cancel()
+    metrics.increment("chat.speculative_codegen.wasted")
+    return route, None
+
+
+# Shared by the blocking and streaming chat calls
+CHAT_MODEL_SETTINGS = {
+    "notebook_content": "",
+    "model_name": "gemini-2.5-pro",
+    "thinking_budget": 128, # -1
+    "temperature": 0.7,
+    "history_token_budget": CHAT_HISTORY_TOKEN_BUDGET,
+    "code_diffs": CHAT_PROMPT_CODE_DIFFS,
+}
+
+
+# Answer when the LLM scheduler turns a call away (queue full or deadline)
+BUSY_ERROR = {"error": "The tutor is busy right now, please try again in a moment."}
+
+
+def _sse_event(event: str, payload: dict) -> str:
+    """
+    Formats one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+# ==============================================================================
+# Chat Endpoints
+# ==============================================================================
+
+@router.post("/chat")
+async def chat_endpoint(request: Request, db: AsyncSession = Depends(get_async_db),
+                        token: Optional[str] = Depends(optional_oauth2_scheme)):
+    try:
+        data = await request.json()
+    except Exception:
+        return JSONResponse(status_code=400, content={"error": "Invalid JSON"})
+
+    parsed = await _parse_chat_request(data, db, token)
+    if isinstance(parsed, JSONResponse):
+        return parsed
+    conversation, lesson_context, session_id = parsed
+
+    try:
+        # Gemini Agents
+        route, pending_code = await _start_turn(lesson_context, conversation)
+
+        agent_code = None
+        if pending_code is not None:
+            agent_code = await pending_code
+
+            # Include the new code in the history to create an appropriate message
+            agent_code_dict = {"author": "agent", "type": "code", "content": agent_code}
+            conversation.append(agent_code_dict)
+
+        # Always chat
+        agent_response = await llm_scheduler.run(
+            CHAT_MODEL_SETTINGS["model_name"],
+            lambda: get_agent_response_async(llm_backend,
+                                             lesson_context["problem_statement"],
+                                             lesson_context["lesson_goals"],
+                                             lesson_context["common_mistakes"],
+                                             conversation,
+                                             **CHAT_MODEL_SETTINGS),
+            session_key = lesson_context["session_key"],
+            deadline = lesson_context["deadline"],
+        )
+
+        await _finish_turn(session_id, conversation, agent_code, agent_response.text)
+
+        return {
+            "author": "agent",
+            "content": agent_response.text,
+            **({"updated_code": agent_code} if agent_code else {}),
+            **({"session_id": str(session_id)} if session_id else {})
+        }
+
+    except LLMRejected as e:
+        print("Agent call rejected:", e)
+        _abort_turn(session_id)
+        return JSONResponse(status_code=503, content=BUSY_ERROR, headers={"Retry-After": "5"})
+
+    except Exception as e:
+        print("Agent error:", e)
+        _abort_turn(session_id)
+        return JSONResponse(status_code=500, content={"error": "Agent processing failed"})
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: Request, db: AsyncSession = Depends(get_async_db),
+                               token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """
+    Streaming variant of /api/chat. Accepts the same payload and answers with
+    Server-Sent Events, in order:
+      - `route`: {"route": "code" | "no_code"} as soon as the router decides.
+      - `code`:  {"updated_code": "..."} once the code agent is done (code turns only).
+      - `token`: {"text": "..."} for every chunk of the chat reply.
+      - `done`:  the same body /api/chat would have returned.
+    Both the legacy and the session payloads are accepted (see _parse_chat_request).
+      - `error`: {"error": "..."} if anything fails midway (a "busy" message
+        when the LLM scheduler turned the call away).
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        return JSONResponse(status_code=400, content={"error": "Invalid JSON"})
+
+    parsed = await _parse_chat_request(data, db, token)
+    if isinstance(parsed, JSONResponse):
+        return parsed
+    conversation, lesson_context, session_id = parsed
+
+    async def event_stream():
+        pending_code = None
+        try:
+            route, pending_code = await _start_turn(lesson_context, conversation)
+            yield _sse_event("route", {"route": route})
+
+            agent_code = None
+            if pending_code is not None:
+                agent_code = await pending_code
+                conversation.append({"author": "agent", "type": "code", "content": agent_code})
+                yield _sse_event("code", {"updated_code": agent_code})
+
+            chunks = []
+            reply = llm_scheduler.stream(
+                CHAT_MODEL_SETTINGS["model_name"],
+                lambda: stream_agent_response_async(llm_backend,
+                                                    lesson_context["problem_statement"],
+                                                    lesson_context["lesson_goals"],
+                                                    lesson_context["common_mistakes"],
+                                                    conversation,
+                                                    **CHAT_MODEL_SETTINGS),
+                session_key = lesson_context["session_key"],
+                deadline = lesson_context["deadline"],
+            )
+            async for text in reply:
+                chunks.append(text)
+                yield _sse_event("token", {"text": text})
+
+            agent_text = "".join(chunks)
+            await _finish_turn(session_id, conversation, agent_code, agent_text)
+
+            yield _sse_event("done", {
+                "author": "agent",
+                "content": agent_text,
+                **({"updated_code": agent_code} if agent_code else {}),
+                **({"session_id": str(session_id)} if session_id else {})
+            })
+        except LLMRejected as e:
+            print("Agent call rejected:", e)
+            _abort_turn(session_id)
+            yield _sse_event("error", BUSY_ERROR)
+        except Exception as e:
+            print("Agent error:", e)
+            _abort_turn(session_id)
+            yield _sse_event("error", {"error": "Agent processing failed"})
+        finally:
+            # The client went away before the code agent was done
+            if pending_code is not None and not pending_code.done():
+                pending_code.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,22 +1,23 @@
 import os
-import frontmatter
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
-from app.utils.parse_problem import parse_problem_content
-
-from google.cloud import storage
-from google.api_core import exceptions
+from app.utils.parse_problem import parse_problem_markdown, PARSER_VERSION
+from app.utils.problem_cache import problem_cache
+from app.utils.problem_store import create_problem_store, ProblemFileNotFound
+from app.utils.catalog_snapshot import catalog_snapshot
 
 # Import project-specific dependencies
-from ..database import get_db
-from .. import models, schemas
+from ..database import get_db, get_async_db
+from .. import crud, models, schemas, metrics
 from ..auth import validate_token
 
 # ==============================================================================
-# Router Configuration & GCS Setup
+# Router Configuration & Problem Store Setup
 # ==============================================================================
 
 router = APIRouter(
@@ -25,24 +26,13 @@ router = APIRouter(
 )
 
 # Load configuration from environment variables
-GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")
+if not ADMIN_USER_ID:
+    print("Warning: ADMIN_USER_ID environment variable is not set.")
 
-# Initialize Google Cloud Storage client
-try:
-    if not GCS_BUCKET_NAME:
-        raise ValueError("GCS_BUCKET_NAME environment variable is not set.")
-    if not ADMIN_USER_ID:
-        raise ValueError("ADMIN_USER_ID environment variable is not set.")
-        
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(GCS_BUCKET_NAME)
-except Exception as e:
-    # If GCS fails, log the error but allow the app to start.
-    # Endpoints that need GCS will fail gracefully.
-    print(f"Warning: Could not initialize GCS client. {e}")
-    storage_client = None
-    bucket = None
+# Where problem files live (GCS bucket or local folder, see PROBLEM_STORE).
+# If it fails, the app still starts and endpoints that need it fail gracefully.
+problem_store = create_problem_store()
 
 # ==============================================================================
 # Authentication Dependencies
@@ -74,50 +64,78 @@ async def require_admin(token: dict = Depends(validate_token)):
     dependencies=[Depends(require_admin)] # Secures this endpoint
 )
 async def upload_problem(
+    response: Response,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
     """
     Admin-only endpoint to upload a new problem.
-    1. Parses the .md file's frontmatter.
-    2. Uploads the full file to Google Cloud Storage.
-    3. Creates a new Problem record in the Postgres database.
+    1. Parses the .md file once (frontmatter and all problem sections).
+    2. Uploads the full file to the problem store (GCS in production).
+    3. Creates a new Problem record in the Postgres database, including the
+       parsed sections so reads never need to touch the store again.
+    Re-uploading a file with the same name updates the problem that points to
+    it (and answers 200 instead of 201), so its stored sections always match
+    the file.
     """
-    if not bucket:
-        raise HTTPException(status_code=500, detail="GCS not initialized")
+    if not problem_store:
+        raise HTTPException(status_code=500, detail="Problem store not initialized")
 
     try:
         content_bytes = await file.read()
         content_str = content_bytes.decode('utf-8')
         
-        post = frontmatter.loads(content_str)
-        metadata = post.metadata
+        metadata, parsed_data, content_hash = parse_problem_markdown(content_str)
         file_path = f"problems/{file.filename}"
 
-        # Upload the full file to GCS
-        blob = bucket.blob(file_path)
-        blob.upload_from_string(
-            content_bytes,
-            content_type='text/markdown'
+        # Look for the problem this file belongs to before touching the store,
+        # locking it so concurrent uploads of the same file take turns
+        problem = (
+            db.query(models.Problem)
+            .filter(models.Problem.file_path == file_path)
+            .with_for_update()
+            .first()
         )
 
-        # Create the new Problem record in Postgres
-        new_problem = models.Problem(
+        # Upload the full file to the problem store
+        await problem_store.write(file_path, content_bytes)
+
+        fields = dict(
             title=metadata.get('title'),
             description=metadata.get('description'),
             difficulty=metadata.get('difficulty'),
             author=metadata.get('author'),
             tags=metadata.get('tags'),
             update_log=metadata.get('update_log'),
-            file_path=file_path
+            parsed_content=parsed_data,
+            content_hash=content_hash,
+            parser_version=PARSER_VERSION
         )
-        
-        db.add(new_problem)
+        if problem is None:
+            # Create the new Problem record in Postgres
+            problem = models.Problem(file_path=file_path, **fields)
+            db.add(problem)
+        else:
+            # The file replaced the one this problem points to: refresh its row
+            for name, value in fields.items():
+                setattr(problem, name, value)
+            response.status_code = status.HTTP_200_OK
+
+        # Bumped in the same transaction, so workers only see the new
+        # version once the problem itself is visible
+        crud.bump_catalog_version(db)
         db.commit()
-        db.refresh(new_problem)
+        db.refresh(problem)
+        problem_cache.invalidate(problem.problem_id)
+        catalog_snapshot.invalidate()
         
-        return new_problem
+        return problem
 
+    except IntegrityError:
+        # Another upload created a problem for this file in the meantime
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"A problem for {file.filename} was uploaded concurrently; retry the upload")
     except Exception as e:
         # If any part fails, roll back the database transaction
         db.rollback()
@@ -125,74 +143,231 @@ async def upload_problem(
         raise HTTPException(status_code=500, detail=f"Failed to upload: {str(e)}")
 
 
-@router.get("/", response_model=List[schemas.Problem])
-async def list_problems(db: Session = Depends(get_db)):
+# Largest page a client can ask for
+MAX_PROBLEM_PAGE_SIZE = 200
+
+
+async def _list_problems_page(db: AsyncSession, request: Request, response: Response, summary: bool, **filters):
     """
-    Fetches the list of all problem metadata from Postgres.
-    This is a fast, public endpoint that does NOT hit GCS.
-    Used to populate the main problem selection page.
+    Runs crud.list_problems_async and exposes the next page's cursor (if any)
+    in the X-Next-Cursor header, so the body stays a plain list.
+
+    The unfiltered, unpaginated listing (what the selection page asks for)
+    is served from the in-memory catalog snapshot with a strong ETag.
     """
+    if not any(filters.values()):
+        return await _catalog_snapshot_response(db, request, "summary" if summary else "full")
+
     try:
-        problems = db.query(models.Problem).all()
-        print(f"Found {len(problems)} problems in database")  # Debug logging
-        return problems
+        problems, next_cursor = await crud.list_problems_async(db, summary=summary, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error querying problems from database: {e}")  # Debug logging
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return problems
+
+
+async def _catalog_snapshot_response(db: AsyncSession, request: Request, view: str):
+    """
+    Serves the pre-rendered catalog, or a 304 if the client already has it.
+    """
+    if_none_match = request.headers.get("if-none-match")
+
+    # Fresh snapshot and a matching ETag: answer without touching the database
+    state = catalog_snapshot.current()
+    if state is not None and _etag_matches(if_none_match, catalog_snapshot.etag_for(state[0])):
+        metrics.increment("catalog_snapshot.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_catalog_headers(state[0]))
+
+    try:
+        version, bodies = await catalog_snapshot.get_async(db)
+    except Exception as e:
+        print(f"Error querying problems from database: {e}")  # Debug logging
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    if _etag_matches(if_none_match, catalog_snapshot.etag_for(version)):
+        metrics.increment("catalog_snapshot.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_catalog_headers(version))
+    return Response(content=bodies[view], media_type="application/json", headers=_catalog_headers(version))
+
+
+def _catalog_headers(version) -> dict:
+    # Browsers may keep the list but must revalidate it before each use
+    return {"ETag": catalog_snapshot.etag_for(version), "Cache-Control": "no-cache"}
+
+
+@router.get("/", response_model=List[schemas.Problem])
+async def list_problems(
+    request: Request,
+    response: Response,
+    difficulty: Optional[str] = None,
+    tag: Optional[str] = None,
+    author: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PROBLEM_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Fetches the list of problem metadata from Postgres.
+    This is a fast, public endpoint that does NOT hit GCS.
+    Used to populate the main problem selection page.
+
+    Optional filters: difficulty, tag, author. Pass `limit` to paginate; the
+    cursor for the next page comes back in the X-Next-Cursor header.
+    Without `limit`, every matching problem is returned. The unfiltered
+    listing comes from the catalog snapshot and supports If-None-Match.
+    """
+    return await _list_problems_page(db, request, response, summary=False, difficulty=difficulty,
+                                     tag=tag, author=author, cursor=cursor, limit=limit)
+
+
+@router.get("/summary", response_model=List[schemas.ProblemSummary])
+async def list_problem_summaries(
+    request: Request,
+    response: Response,
+    difficulty: Optional[str] = None,
+    tag: Optional[str] = None,
+    author: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PROBLEM_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Same as list_problems, but only selects the columns the selection page
+    shows (no file_path, update_log or parsed content).
+    """
+    return await _list_problems_page(db, request, response, summary=True, difficulty=difficulty,
+                                     tag=tag, author=author, cursor=cursor, limit=limit)
+
+
+def _problem_etag(problem_id, generation) -> str:
+    """
+    Strong ETag for a problem detail. The file generation changes every time
+    the markdown file is overwritten, so it identifies the content exactly.
+    """
+    return f'"{problem_id}-{generation}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an If-None-Match header (which may list several tags) against an ETag.
+    """
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
 
 @router.get("/{problem_id}", response_model=schemas.ProblemDetail)
 async def get_single_problem_details(
     problem_id: UUID,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Fetches a single problem's complete details.
-    1. Gets all metadata from Postgres.
-    2. Gets the full markdown file content from GCS.
+    0. Returns the cached ProblemDetail if this worker has already built it.
+    1. Gets the problem row from Postgres. Problems parsed at upload time
+       are answered from that row alone.
+    2. Otherwise (not backfilled yet), gets the full markdown file from the
+       problem store and parses it. Expired cache entries are revalidated
+       with a metadata-only store call and only re-downloaded if the file
+       generation changed.
     3. Combines them into a single ProblemDetail response.
+    Responses carry an ETag so browsers can revalidate with If-None-Match.
     """
-    if not bucket:
-        raise HTTPException(status_code=500, detail="GCS not initialized")
+    if_none_match = request.headers.get("if-none-match")
+
+    cached_entry = problem_cache.get_entry(problem_id)
+    if cached_entry is not None and not cached_entry["stale"]:
+        metrics.increment("problem_cache.hits")
+        return _problem_response(problem_id, cached_entry["detail"], cached_entry["generation"], if_none_match, response)
+    # From here on, expired entries confirmed current count as
+    # problem_cache.revalidations and rebuilt responses as misses
 
-    # 1. Get metadata from Postgres
-    problem_db = db.query(models.Problem).filter(models.Problem.problem_id == problem_id).first()
+    # 1. Get the problem row from Postgres
+    problem_db = await crud.get_problem_async(db, problem_id)
         
     if not problem_db:
         raise HTTPException(status_code=404, detail="Problem not found")
 
+    # 1a. Pre-parsed at upload time: the row is all we need
+    if problem_db.parsed_content is not None and problem_db.parser_version == PARSER_VERSION:
+        generation = problem_db.content_hash
+        if cached_entry is not None and cached_entry["generation"] == generation:
+            problem_cache.refresh(problem_id)
+            return _problem_response(problem_id, cached_entry["detail"], generation, if_none_match, response)
+
+        metrics.increment("problem_cache.misses")
+        final_response = _build_problem_detail(problem_db, problem_db.parsed_content)
+        problem_cache.put(problem_id, final_response, generation=generation)
+        return _problem_response(problem_id, final_response, generation, if_none_match, response)
+
+    if not problem_store:
+        raise HTTPException(status_code=500, detail="Problem store not initialized")
+
     try:
-        # 2. Get the full file content from GCS
-        blob = bucket.blob(problem_db.file_path)
-        markdown_content = blob.download_as_text()
-        
-        # 3. Separate frontmatter from the main content
-        post = frontmatter.loads(markdown_content)
-
-        # 4. Call your parser with the content and metadata
-        #    This returns a dict with all your parsed fields
-        parsed_data = parse_problem_content(post.content, post.metadata)
-
-        # 5. Get the base data from the DB model
-        #    (Using the 'Problem' schema we assumed you have)
-        db_data = schemas.Problem.model_validate(problem_db).model_dump()
-
-        # 6. Combine the two dictionaries
-        #    Start with DB data, then add/overwrite with parsed data
-        final_data_dict = {**db_data, **parsed_data}
-
-        # 7. Validate the final flat object against the response schema
-        #    This ensures the data is correct before sending
-        try:
-            final_response = schemas.ProblemDetail.model_validate(final_data_dict)
-            return final_response
-        except Exception as validation_error:
-            # This is for debugging schema mismatches
-            print(f"FINAL RESPONSE VALIDATION FAILED: {validation_error}")
-            raise HTTPException(500, detail=f"Response validation error: {validation_error}")
-        
-    except exceptions.NotFound:
-        raise HTTPException(status_code=404, detail=f"File not found in GCS for problem {problem_id}")
+        # 2. Get the file's metadata (generation) without its content
+        file_stat = await problem_store.stat(problem_db.file_path)
+
+        # 2a. Same generation as our cached copy: nothing to download
+        if cached_entry is not None and cached_entry["generation"] == file_stat["generation"]:
+            problem_cache.refresh(problem_id)
+            return _problem_response(problem_id, cached_entry["detail"], file_stat["generation"], if_none_match, response)
+
+        # 2b. Get the full file content from the store and parse it
+        metrics.increment("problem_cache.misses")
+        markdown_content, generation = await problem_store.read(problem_db.file_path, generation=file_stat["generation"])
+        _, parsed_data, _ = parse_problem_markdown(markdown_content)
+
+        # 3. Combine DB data and parsed data into the response
+        final_response = _build_problem_detail(problem_db, parsed_data)
+        problem_cache.put(problem_id, final_response, generation=generation)
+        return _problem_response(problem_id, final_response, generation, if_none_match, response)
+
+    except HTTPException:
+        raise
+    except ProblemFileNotFound:
+        raise HTTPException(status_code=404, detail=f"File not found in problem store for problem {problem_id}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching file: {str(e)}")
 
+
+def _build_problem_detail(problem_db: models.Problem, parsed_data: dict) -> schemas.ProblemDetail:
+    """
+    Combines a Problem row with the output of parse_problem_content.
+    """
+    # Get the base data from the DB model
+    db_data = schemas.Problem.model_validate(problem_db).model_dump()
+
+    # Start with DB data, then add/overwrite with parsed data
+    final_data_dict = {**db_data, **parsed_data}
+
+    # Validate the final flat object against the response schema.
+    # This ensures the data is correct before sending
+    try:
+        return schemas.ProblemDetail.model_validate(final_data_dict)
+    except Exception as validation_error:
+        # This is for debugging schema mismatches
+        print(f"FINAL RESPONSE VALIDATION FAILED: {validation_error}")
+        raise HTTPException(500, detail=f"Response validation error: {validation_error}")
+
+
+def _problem_response(problem_id, detail, generation, if_none_match, response: Response):
+    """
+    Returns a 304 if the client already holds this generation, otherwise the
+    detail itself with ETag and Cache-Control headers attached.
+    """
+    etag = _problem_etag(problem_id, generation)
+    # Browsers may keep the copy but must revalidate it before each use
+    cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        metrics.increment("problem_detail.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    response.headers.update(cache_headers)
+    return detail
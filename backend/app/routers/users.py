@@ -1,20 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, schemas
-from ..database import SessionLocal, get_db
+from ..database import get_async_db
+from ..utils.user_cache import user_cache
 
 router = APIRouter()
 
 # This is called in frontend/src/components/ProblemSelection/index.tsx
 @router.post("/users/", response_model=schemas.User)
-def create_or_get_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_or_get_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     This endpoint is called by the frontend after a user logs in.
     It checks if the user exists in our database. If so, it returns the user.
     If not, it creates the user and then returns them.
+    Both happen in one upsert; users seen recently by this worker are
+    answered from user_cache without touching the database.
     """
-    db_user = crud.get_user(db, user_id=user.user_id)
-    if db_user:
-        return db_user
-    return crud.create_user(db=db, user=user)
\ No newline at end of file
+    cached_user = user_cache.get(user.user_id)
+    if cached_user is not None:
+        return cached_user
+
+    db_user = schemas.User.model_validate(await crud.upsert_user_async(db, user=user))
+    user_cache.put(db_user)
+    return db_user
\ No newline at end of file
@@ -41,6 +41,19 @@ class Problem(ProblemBase):
     class Config:
         from_attributes = True
 
+# Lightweight projection used by the problem selection page
+class ProblemSummary(BaseModel):
+    problem_id: UUID
+    title: str
+    description: Optional[str] = None
+    difficulty: Optional[str] = None
+    author: Optional[str] = None
+    tags: Optional[List[str]] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class Milestone(BaseModel):
     number: int
     content: str
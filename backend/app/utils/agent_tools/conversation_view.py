@@ -0,0 +1,260 @@
+# File: backend/utils/agent_tools/conversation_view.py
+import difflib
+from collections import deque
+from typing import List, Dict, Any, Optional, Union, NamedTuple
+
+# Number of most recent events kept pre-rendered. Must cover the largest
+# history_limit used by the prompt builders (15 today).
+RENDERED_WINDOW = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English and Python)."""
+    return len(text) // 4 + 1
+
+
+def render_event(event: Dict[str, Any]) -> Optional[str]:
+    """Renders one conversation event as a markdown history line.
+
+    Args:
+        event (Dict[str, Any]): A chat or code event ({"author", "type", "content"}).
+
+    Returns:
+        Optional[str]: The rendered line, or None for events that are not shown
+                       in the history (e.g. outputs).
+    """
+    author = event.get('author', 'system').capitalize()
+    content = event.get('content', '')
+    if event.get('type') == 'chat':
+        return f"- {author} says: {content}"
+    if event.get('type') == 'code':
+        return f"- {author}'s code:\n```python\n{content}\n```"
+    return None
+
+
+def _code_author(event: Dict[str, Any]) -> Optional[str]:
+    """Author of a code event. Code events without one are the agent's."""
+    return event.get('author', 'agent')
+
+
+class _RenderedEvent:
+    """An event rendered once for the window.
+
+    For code events it also keeps the author's previous snapshot, so the
+    event can be shown as a diff (computed on first use) or, when even that
+    does not fit the token budget, as a one-line summary.
+    """
+    __slots__ = ("line", "tokens", "author", "content", "previous", "_diff")
+
+    def __init__(self, event: Dict[str, Any], line: str, previous: Optional[str]):
+        self.line = line
+        self.tokens = estimate_tokens(line)
+        self.author = _code_author(event) if event.get('type') == 'code' else None
+        self.content = event.get('content', '')
+        self.previous = previous
+        self._diff = None
+
+    @property
+    def is_code(self) -> bool:
+        return self.author is not None
+
+    @property
+    def summary(self) -> str:
+        name = (self.author or 'system').capitalize()
+        return f"- {name}'s code: (older version, {len(self.content.splitlines())} lines, omitted)"
+
+    def diff(self):
+        """(line, tokens) showing this snapshot as a unified diff against the
+        author's previous one, or None if there is no previous snapshot."""
+        if self.previous is None:
+            return None
+        if self._diff is None:
+            name = (self.author or 'system').capitalize()
+            changes = list(difflib.unified_diff(self.previous.splitlines(), self.content.splitlines(),
+                                                fromfile = "before", tofile = "after", lineterm = "", n = 1))
+            if changes:
+                line = f"- {name}'s code change:\n```diff\n" + "\n".join(changes) + "\n```"
+            else:
+                line = f"- {name}'s code: (unchanged)"
+            self._diff = (line, estimate_tokens(line))
+        return self._diff
+
+
+class HistoryPack(NamedTuple):
+    """What pack_history put in the prompt, for reporting."""
+    text: str
+    events: int      # events rendered in full
+    summarized: int  # code events replaced by a one-line summary
+    dropped: int     # older events left out to meet the budget
+    tokens: int      # estimated tokens of the history plus the latest code
+
+
+class ConversationView:
+    """An incrementally maintained view over a conversation_history.
+
+    The prompt builders (code turn, chat turn and router) all need the latest
+    code of each author, the last user message and the last N events rendered
+    as markdown. Instead of each of them walking and re-rendering the history,
+    the view updates that state once per appended event (O(1)) and keeps the
+    most recent RENDERED_WINDOW events already rendered.
+
+    The raw events stay available in `events`, in chronological order.
+    """
+
+    def __init__(self, window: int = RENDERED_WINDOW):
+        self.events: List[Dict[str, Any]] = []
+        self.window = window
+        # One _RenderedEvent per event (None for events that render to
+        # nothing), so slicing the last N entries matches slicing the last N
+        # events.
+        self._rendered = deque(maxlen=window)
+        self._latest_code = {}
+        # Last code snapshot of each author, empty ones included (for diffs)
+        self._last_snapshot = {}
+        self._agent_codes = deque(maxlen=2)
+        self.last_user_message = ""
+
+    @classmethod
+    def from_history(cls, conversation_history: List[Dict[str, Any]], window: int = RENDERED_WINDOW) -> "ConversationView":
+        """Builds a view from a plain list of events.
+
+        Only the events that fall inside the rendered window are rendered.
+        """
+        view = cls(window = window)
+        first_rendered = len(conversation_history) - window
+        for index, event in enumerate(conversation_history):
+            view._append(event, render = index >= first_rendered)
+        return view
+
+    def append(self, event: Dict[str, Any]):
+        """Adds a new event at the end of the conversation."""
+        self._append(event, render = True)
+
+    def extend(self, events: List[Dict[str, Any]]):
+        for event in events:
+            self.append(event)
+
+    def _append(self, event: Dict[str, Any], render: bool):
+        self.events.append(event)
+        event_type = event.get('type')
+        author = _code_author(event) if event_type == 'code' else event.get('author')
+        content = event.get('content', '')
+        if render:
+            self._rendered.append(self._render(event, self._last_snapshot.get(author)))
+
+        if event_type == 'code':
+            self._last_snapshot[author] = content
+            if author == 'agent':
+                self._agent_codes.append(content)
+            if content:
+                self._latest_code[author] = content
+        elif event_type == 'chat' and author == 'user' and content:
+            self.last_user_message = content
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def latest_code(self, author: str) -> str:
+        """The most recent non-empty code snapshot from an author ("" if none)."""
+        return self._latest_code.get(author, "")
+
+    def last_agent_codes(self) -> List[str]:
+        """Up to the last two agent code snapshots, oldest first."""
+        return list(self._agent_codes)
+
+    @staticmethod
+    def _render(event: Dict[str, Any], previous: Optional[str]) -> Optional[_RenderedEvent]:
+        line = render_event(event)
+        if line is None:
+            return None
+        return _RenderedEvent(event, line, previous if event.get('type') == 'code' else None)
+
+    def _recent_entries(self, history_limit: int) -> list:
+        if 0 < history_limit <= self.window:
+            return list(self._rendered)[-history_limit:]
+        # Outside the window (history_limit 0 keeps the old [-0:] meaning: everything).
+        # Rare, so the previous snapshots are looked up by walking the events.
+        events = self.events[-history_limit:]
+        start = len(self.events) - len(events)
+        last_snapshot = {}
+        for event in self.events[:start]:
+            if event.get('type') == 'code':
+                last_snapshot[_code_author(event)] = event.get('content', '')
+        entries = []
+        for event in events:
+            entries.append(self._render(event, last_snapshot.get(_code_author(event))))
+            if event.get('type') == 'code':
+                last_snapshot[_code_author(event)] = event.get('content', '')
+        return entries
+
+    def pack_history(self, history_limit: int, token_budget: Optional[int] = None,
+                     code_diffs: bool = False) -> HistoryPack:
+        """Renders the recent history so that it fits an estimated token budget.
+
+        The latest agent and user code are always part of the prompt (in their
+        own sections), so their size is reserved first. The remaining budget is
+        filled from the newest event backwards: events are kept in full while
+        they fit, older code snapshots that do not fit are summarised in one
+        line, and everything older than the first event that does not fit at
+        all is dropped. The newest event is always kept. history_limit still
+        caps the number of events considered.
+
+        With code_diffs, only the newest code snapshot of each author is shown
+        in full; older ones are shown as unified diffs against the author's
+        previous snapshot (consecutive snapshots usually differ by one line).
+
+        Args:
+            history_limit (int): Maximum number of recent events to consider.
+            token_budget (int, optional): Estimated tokens for the history and the
+                                          latest code. None disables the budget.
+            code_diffs (bool): Show older code snapshots as diffs.
+
+        Returns:
+            HistoryPack: The rendered history and what was kept, summarised or dropped.
+        """
+        entries = [entry for entry in self._recent_entries(history_limit) if entry is not None]
+        reserved = sum(estimate_tokens(self.latest_code(author)) for author in ("agent", "user"))
+
+        # Pick each event's rendering, newest first
+        lines = []
+        seen_code_authors = set()
+        for entry in reversed(entries):
+            line, tokens = entry.line, entry.tokens
+            if entry.is_code:
+                if code_diffs and entry.author in seen_code_authors:
+                    line, tokens = entry.diff() or (line, tokens)
+                seen_code_authors.add(entry.author)
+            lines.append((line, tokens, entry.summary if entry.is_code else None))
+
+        if token_budget is None:
+            text = "\n".join(line for line, _, _ in reversed(lines))
+            return HistoryPack(text, len(lines), 0, 0, reserved + sum(tokens for _, tokens, _ in lines))
+
+        available = token_budget - reserved
+        used = 0
+        kept = []
+        summarized = 0
+        for position, (line, tokens, summary) in enumerate(lines):
+            if position == 0 or used + tokens <= available:
+                kept.append(line)
+                used += tokens
+            elif summary is not None and used + estimate_tokens(summary) <= available:
+                kept.append(summary)
+                used += estimate_tokens(summary)
+                summarized += 1
+            else:
+                break
+
+        full = len(kept) - summarized
+        dropped = len(entries) - len(kept)
+        if dropped:
+            kept.append(f"- ({dropped} earlier events omitted)")
+        kept.reverse()
+        return HistoryPack("\n".join(kept), full, summarized, dropped, reserved + used)
+
+
+def as_conversation_view(conversation_history: Union[List[Dict[str, Any]], ConversationView]) -> ConversationView:
+    """Lets the prompt builders accept either a plain history list or a view."""
+    if isinstance(conversation_history, ConversationView):
+        return conversation_history
+    return ConversationView.from_history(conversation_history)
@@ -1,9 +1,11 @@
 # File: backend/utils/agent_tools/openai_agent.py
-from google import genai
-from google.genai import types
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union, Optional
 import re
 
+from app.utils.agent_tools.conversation_view import ConversationView, as_conversation_view
+from app.utils.agent_tools.llm_backends import LLMRequest, as_llm_backend
+from app import metrics
+
 def create_code_system_prompt(
     problem_description: str,
     lesson_goals: list,
@@ -69,8 +71,10 @@ from typing import List, Dict, Any
 
 def create_code_turn_prompt(
     notebook_content: str,
-    conversation_history: List[Dict[str, Any]],
-    history_limit: int = 15
+    conversation_history: Union[List[Dict[str, Any]], ConversationView],
+    history_limit: int = 15,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False
 ) -> str:
     """Generates the dynamic user-side prompt for a single turn of the conversation.
 
@@ -81,48 +85,27 @@ def create_code_turn_prompt(
 
     Args:
         notebook_content (str): The current state of the "knowledge notebook."
-        conversation_history (List[Dict[str, Any]]): The full list of chat and code events.
+        conversation_history (List[Dict[str, Any]] | ConversationView): The full list of chat and
+                                                                        code events, or a view over it.
         history_limit (int): The number of recent history events to include in the prompt.
+        history_token_budget (int, optional): Estimated token budget for the history and the latest
+                                              code (see ConversationView.pack_history). None keeps
+                                              only the history_limit cut.
+        code_diffs (bool): Show older code snapshots in the history as diffs against the author's
+                           previous snapshot. The latest code is always shown in full.
 
     Returns:
         str: A fully formatted user-side prompt for the current turn.
     """
 
-    # --- 1. Find the last code from both the AGENT and the USER from the history ---
-    your_previous_code = ""
-    user_current_code = ""
-    
-    for event in reversed(conversation_history):
-        if event.get('type') == 'code':
-            author = event.get("author", 'agent')
-            content = event.get("content", "")
-            if author == "agent" and not your_previous_code:
-                your_previous_code = content
-            elif author == "user" and not user_current_code:
-                user_current_code = content
-        
-        if your_previous_code and user_current_code:
-            break
-
-    if not your_previous_code:
-        your_previous_code = "# Start typing your code here..."
-    if not user_current_code:
-        user_current_code = "# The user has not written any code yet."
+    view = as_conversation_view(conversation_history)
 
+    # --- 1. Find the last code from both the AGENT and the USER from the history ---
+    your_previous_code = view.latest_code("agent") or "# Start typing your code here..."
+    user_current_code = view.latest_code("user") or "# The user has not written any code yet."
 
     # --- 2. Build the chronological history string, INCLUDING code changes ---
-    limited_history = conversation_history[-history_limit:]
-    history_log = []
-    for event in limited_history:
-        author = event.get('author', 'system').capitalize()
-        content = event.get('content', '')
-        if event.get('type') == 'chat':
-            history_log.append(f"- {author} says: {content}")
-        elif event.get('type') == 'code':
-            # This line is now active to include the code's history
-            history_log.append(f"- {author}'s code:\n```python\n{content}\n```")
-
-    history_str = "\n".join(history_log)
+    history_str = _pack_history("code", view, history_limit, history_token_budget, code_diffs)
 
     # --- 3. Assemble the final prompt using the correct labels ---
     user_prompt = f"""
@@ -152,6 +135,18 @@ def create_code_turn_prompt(
     
     return user_prompt
 
+def _pack_history(kind: str, view: ConversationView, history_limit: int,
+                  history_token_budget: Optional[int], code_diffs: bool = False) -> str:
+    """Packs the view's recent history and reports the chosen size under prompt.<kind>.*."""
+    pack = view.pack_history(history_limit, history_token_budget, code_diffs)
+    metrics.observe(f"prompt.{kind}.history_tokens", pack.tokens)
+    metrics.observe(f"prompt.{kind}.history_events", pack.events)
+    if pack.summarized:
+        metrics.increment(f"prompt.{kind}.summarized_events", pack.summarized)
+    if pack.dropped:
+        metrics.increment(f"prompt.{kind}.dropped_events", pack.dropped)
+    return pack.text
+
 def extract_python_code(text: str) -> str:
     """
     Checks for a ```python ... ``` markdown block and extracts the code.
@@ -187,6 +182,8 @@ def get_agent_code(
     model_name: str = "gemini-2.5-pro",
     thinking_budget: int = -1,
     temperature: float = 0.2,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
 ):
     """Orchestrates a call to the Gemini API to get a code response from the tutor agent.
 
@@ -198,7 +195,7 @@ def get_agent_code(
     5. Returns the model's response.
 
     Args:
-        client: An initialized Gemini API client instance.
+        client: An initialized Gemini API client instance, or any LLMBackend (see llm_backends).
         problem_description (str): A description of the overall coding problem.
         lesson_goals (list): The specific concepts the user is learning.
         common_mistakes (list): A list of mistakes the AI can make.
@@ -211,44 +208,103 @@ def get_agent_code(
                                          -1 enables dynamic thinking. 0 disables it. Defaults to -1.
         temperature (float, optional): Controls the randomness of the output. Lower is more deterministic.
                                        Defaults to 0.2.
+        history_token_budget (int, optional): Estimated token budget for the history in the turn prompt.
+                                              None keeps the fixed event-count cut.
+        code_diffs (bool, optional): Show older code snapshots in the history as diffs. Defaults to False.
 
     Returns:
-        The full response object from the client.models.generate_content call.
+        str: The extracted Python code.
     """
     
+    # 1-3. Build the system prompt, the turn prompt and the generation settings.
+    request = _build_code_request(problem_description,
+                                  lesson_goals,
+                                  common_mistakes,
+                                  conversation_history,
+                                  notebook_content,
+                                  history_limit,
+                                  thinking_budget,
+                                  temperature,
+                                  history_token_budget,
+                                  code_diffs)
+
+    # 4-5. Send the request (to Gemini unless another backend is given) and return the code.
+    response = as_llm_backend(client).generate(model_name, request)
+
+    clean_code = extract_python_code(response.text)
+    
+    return clean_code
+
+async def get_agent_code_async(
+    client,
+    problem_description: str,
+    lesson_goals: list,
+    common_mistakes: list,
+    conversation_history: List[Dict[str, Any]],
+    notebook_content: str = "",  
+    history_limit: int = 15,
+    model_name: str = "gemini-2.5-pro",
+    thinking_budget: int = -1,
+    temperature: float = 0.2,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
+):
+    """Async variant of get_agent_code.
+
+    Uses the backend's async client (client.aio for Gemini), so the event loop
+    keeps serving other requests while the model is thinking.
+
+    Args:
+        Same as get_agent_code.
+
+    Returns:
+        str: The extracted Python code.
+    """
+    request = _build_code_request(problem_description,
+                                  lesson_goals,
+                                  common_mistakes,
+                                  conversation_history,
+                                  notebook_content,
+                                  history_limit,
+                                  thinking_budget,
+                                  temperature,
+                                  history_token_budget,
+                                  code_diffs)
+
+    response = await as_llm_backend(client).generate_async(model_name, request)
+
+    return extract_python_code(response.text)
+
+def _build_code_request(
+    problem_description: str,
+    lesson_goals: list,
+    common_mistakes: list,
+    conversation_history: List[Dict[str, Any]],
+    notebook_content: str,
+    history_limit: int,
+    thinking_budget: int,
+    temperature: float,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
+) -> LLMRequest:
+    """Builds the request shared by the sync and async code calls.
+
+    Returns:
+        LLMRequest: The prompts and generation settings, ready for any LLMBackend.
+    """
     # 1. Create the static system prompt that defines the AI's persona and rules.
     system_prompt = create_code_system_prompt(problem_description, lesson_goals, common_mistakes)
 
     # 2. Create the dynamic turn prompt with the latest contextual information.
-    turn_prompt = create_code_turn_prompt(notebook_content, conversation_history, history_limit)
-
-    # 3. Prepare the main content payload for the API request.
-    contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part.from_text(text = turn_prompt)],
-            )
-        ]
-
-    # 4. Configure all generation settings, including the system prompt and model parameters.
-    generate_content_config = types.GenerateContentConfig(
-        thinking_config = types.ThinkingConfig(thinking_budget = thinking_budget),
-        system_instruction = system_prompt,
-        temperature = temperature,
-        # max_output_tokens = max_output_tokens,
-        tools = [],
-    )
-
-    # 5. Make the API call to the Gemini model with the specified configuration.
-    response = client.models.generate_content(
-        model = model_name,
-        contents = contents,
-        config = generate_content_config
-    )
+    turn_prompt = create_code_turn_prompt(notebook_content, conversation_history, history_limit,
+                                          history_token_budget, code_diffs)
 
-    clean_code = extract_python_code(response.text)
-    
-    return clean_code
+    # 3. Bundle them with the generation settings.
+    return LLMRequest(kind = "code",
+                      system_prompt = system_prompt,
+                      prompt = turn_prompt,
+                      temperature = temperature,
+                      thinking_budget = thinking_budget)
 
 def create_chat_system_prompt(
     problem_description: str,
@@ -301,51 +357,34 @@ You are a 20-something Gen Z coding partner working with the user on a project.
     return system_prompt
 
 def create_chat_turn_prompt(
-    conversation_history: List[Dict[str, Any]], 
+    conversation_history: Union[List[Dict[str, Any]], ConversationView],
     notebook_content: str, 
-    history_limit: int = 15
+    history_limit: int = 15,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False
 ) -> str:
     """
     Creates a simple, consistent, and context-rich prompt for the conversational agent.
     This function provides the full history and key code states, allowing the LLM to
     determine the correct response based on a static set of instructions.
+    Accepts the history as a plain list or as a ConversationView. With a
+    history_token_budget, the history is packed to fit it instead of being
+    cut at history_limit events only; with code_diffs, older code snapshots
+    are shown as diffs.
     """
     
+    view = as_conversation_view(conversation_history)
+
     # --- 1. Find the last two agent codes and the last user code ---
-    agent_codes = []
-    last_user_code = ""
-    for event in reversed(conversation_history):
-        event_type = event.get('type')
-        author = event.get('author')
-        
-        if event_type == 'code':
-            if author == 'agent' and len(agent_codes) < 2:
-                agent_codes.append(event.get('content', ''))
-            elif author == 'user' and not last_user_code:
-                last_user_code = event.get('content', '')
-        
-        # Optimization: Break the loop once all necessary code has been found.
-        if len(agent_codes) == 2 and last_user_code:
-            break
-            
-    agent_codes.reverse() # Put them back in chronological order [before, after]
+    agent_codes = view.last_agent_codes() # Chronological order [before, after]
 
     # Assign to clear variables with sensible defaults
     agent_code_before_change = agent_codes[0] if len(agent_codes) > 0 else "# No previous agent code."
     agent_code_after_change = agent_codes[1] if len(agent_codes) > 1 else agent_code_before_change
-    last_user_code = last_user_code if last_user_code else "# User has not written any code yet."
-    
+    last_user_code = view.latest_code("user") or "# User has not written any code yet."
+
     # --- 2. Build the chronological history string ---
-    limited_history = conversation_history[-history_limit:]
-    history_log = []
-    for event in limited_history:
-        author = event.get('author', 'system').capitalize()
-        content = event.get('content', '')
-        if event.get('type') == 'chat':
-            history_log.append(f"- {author} says: {content}")
-        elif event.get('type') == 'code':
-            history_log.append(f"- {author}'s code:\n```python\n{content}\n```")
-    history_str = "\n".join(history_log)
+    history_str = _pack_history("chat", view, history_limit, history_token_budget, code_diffs)
 
     notebook_content_str = notebook_content if notebook_content else "The notebook is currently empty."
 
@@ -396,6 +435,8 @@ def get_agent_response(
     model_name: str = "gemini-2.5-pro",
     thinking_budget: int = -1,
     temperature: float = 0.7,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
 ):
     """Orchestrates a call to the Gemini API to get a chat response from the tutor agent.
     This function is the primary interface for the conversational agent. It:
@@ -405,7 +446,7 @@ def get_agent_response(
     4. Returns the model's response.
 
     Args:
-        client: An initialized Gemini API client instance.
+        client: An initialized Gemini API client instance, or any LLMBackend (see llm_backends).
         problem_description (str): Description of the overall coding problem.
         lesson_goals (list): The specific concepts the user is learning.
         common_mistakes (list): A list of mistakes to inform the AI's flawed logic.
@@ -416,47 +457,137 @@ def get_agent_response(
                                          -1 enables dynamic thinking. 0 disables it. Defaults to -1.
         temperature (float, optional): Controls the randomness of the output. Higher is more creative.
                                     Defaults to 0.7 for a more conversational feel.
+        history_token_budget (int, optional): Estimated token budget for the history in the turn prompt.
+                                              None keeps the fixed event-count cut.
+        code_diffs (bool, optional): Show older code snapshots in the history as diffs. Defaults to False.
 
     Returns:
-        The full response object from the client.models.generate_content call.
+        LLMResponse: The reply; its .text is the chat message.
     """
     
+    # 1-4. Build the prompts and the generation settings.
+    request = _build_chat_request(problem_description,
+                                  lesson_goals,
+                                  common_mistakes,
+                                  conversation_history,
+                                  notebook_content,
+                                  thinking_budget,
+                                  temperature,
+                                  history_token_budget,
+                                  code_diffs)
+    
+    # 5. Send the request (to Gemini unless another backend is given).
+    return as_llm_backend(client).generate(model_name, request)
+
+async def get_agent_response_async(
+    client,
+    problem_description: str,
+    lesson_goals: list,
+    common_mistakes: list,
+    conversation_history: List[Dict[str, Any]],
+    notebook_content: str = "",
+    model_name: str = "gemini-2.5-pro",
+    thinking_budget: int = -1,
+    temperature: float = 0.7,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
+):
+    """Async variant of get_agent_response, using the backend's async client (client.aio for Gemini).
+
+    Args:
+        Same as get_agent_response.
+
+    Returns:
+        LLMResponse: The reply; its .text is the chat message.
+    """
+    request = _build_chat_request(problem_description,
+                                  lesson_goals,
+                                  common_mistakes,
+                                  conversation_history,
+                                  notebook_content,
+                                  thinking_budget,
+                                  temperature,
+                                  history_token_budget,
+                                  code_diffs)
+
+    return await as_llm_backend(client).generate_async(model_name, request)
+
+async def stream_agent_response_async(
+    client,
+    problem_description: str,
+    lesson_goals: list,
+    common_mistakes: list,
+    conversation_history: List[Dict[str, Any]],
+    notebook_content: str = "",
+    model_name: str = "gemini-2.5-pro",
+    thinking_budget: int = -1,
+    temperature: float = 0.7,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
+):
+    """Streaming variant of get_agent_response_async.
+
+    Sends the same request as a streamed call (generate_content_stream on
+    client.aio for Gemini) and yields the chat text chunk by chunk as the
+    model produces it, so the caller can forward tokens to the student before
+    the full answer is ready.
+
+    Args:
+        Same as get_agent_response.
+
+    Yields:
+        str: The text of each streamed chunk (empty chunks are skipped).
+    """
+    request = _build_chat_request(problem_description,
+                                  lesson_goals,
+                                  common_mistakes,
+                                  conversation_history,
+                                  notebook_content,
+                                  thinking_budget,
+                                  temperature,
+                                  history_token_budget,
+                                  code_diffs)
+
+    async for text in as_llm_backend(client).stream_async(model_name, request):
+        yield text
+
+def _build_chat_request(
+    problem_description: str,
+    lesson_goals: list,
+    common_mistakes: list,
+    conversation_history: List[Dict[str, Any]],
+    notebook_content: str,
+    thinking_budget: int,
+    temperature: float,
+    history_token_budget: Optional[int] = None,
+    code_diffs: bool = False,
+) -> LLMRequest:
+    """Builds the request shared by the blocking and streaming chat calls.
+
+    Returns:
+        LLMRequest: The prompts and generation settings, ready for any LLMBackend.
+    """
     # 1. Create the static system prompt defining the AI's persona.
     system_prompt = create_chat_system_prompt(problem_description, lesson_goals, common_mistakes)
 
     # 2. Create the dynamic prompt with the specific task for this turn.
-    turn_prompt = create_chat_turn_prompt(conversation_history, notebook_content)
-
-    # 3. Prepare the main content payload for the API request.
-    contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part.from_text(text = turn_prompt)],
-            )
-        ]
-
-    # 4. Configure all generation settings for the API call.
-    generate_content_config = types.GenerateContentConfig(
-        thinking_config = types.ThinkingConfig(thinking_budget = thinking_budget),
-        system_instruction = system_prompt,
-        temperature = temperature,
-        # max_output_tokens = max_output_tokens,
-        tools = [],
-    )
-    
-    # 5. Send the request to the Gemini model.
-    response = client.models.generate_content(
-        model = model_name,
-        contents = contents,
-        config = generate_content_config
-    )
-    
-    return response
+    turn_prompt = create_chat_turn_prompt(conversation_history, notebook_content,
+                                          history_token_budget = history_token_budget,
+                                          code_diffs = code_diffs)
+
+    # 3. Bundle them with the generation settings.
+    return LLMRequest(kind = "chat",
+                      system_prompt = system_prompt,
+                      prompt = turn_prompt,
+                      temperature = temperature,
+                      thinking_budget = thinking_budget)
 
 def routing_agent(client,
                   conversation_history: List[Dict[str, Any]],
                   history_limit: int = 10,
-                  model_name = "gemini-2.5-flash-lite"
+                  model_name = "gemini-2.5-flash-lite",
+                  history_token_budget: Optional[int] = None,
+                  code_diffs: bool = False
                   ):
     """
     Analyzes the conversation to decide if the next step requires coding.
@@ -466,6 +597,52 @@ def routing_agent(client,
     user message and the current state of the code.
     """
 
+    # 1-5. Build the prompts and the generation settings.
+    request = _build_routing_request(conversation_history, history_limit, history_token_budget, code_diffs)
+    
+    # 6. Send the request (to Gemini unless another backend is given).
+    response = as_llm_backend(client).generate(model_name, request)
+
+    return _parse_route(response.text)
+
+async def routing_agent_async(client,
+                              conversation_history: List[Dict[str, Any]],
+                              history_limit: int = 10,
+                              model_name = "gemini-2.5-flash-lite",
+                              history_token_budget: Optional[int] = None,
+                              code_diffs: bool = False
+                              ):
+    """
+    Async variant of routing_agent, using the backend's async client (client.aio for Gemini).
+    Returns "code" or "no_code".
+    """
+    request = _build_routing_request(conversation_history, history_limit, history_token_budget, code_diffs)
+
+    response = await as_llm_backend(client).generate_async(model_name, request)
+
+    return _parse_route(response.text)
+
+def _parse_route(text: str) -> str:
+    """
+    Normalises the router's answer. Anything unexpected counts as "no_code".
+    """
+    response = (text or "").strip()
+
+    if response not in ["code", "no_code"]:
+        return "no_code"
+    
+    return response
+
+def _build_routing_request(conversation_history: Union[List[Dict[str, Any]], ConversationView],
+                           history_limit: int,
+                           history_token_budget: Optional[int] = None,
+                           code_diffs: bool = False):
+    """Builds the request shared by the sync and async routing calls.
+
+    Returns:
+        LLMRequest: The prompts and generation settings, ready for any LLMBackend.
+    """
+
     # --- 1. Define the System Prompt: The Agent's Core Rules ---
     system_prompt = """
 You are an expert routing agent. Your sole purpose is to determine if the next action in a conversation should be to write code or to send a chat message. You must respond with ONLY ONE of two possible strings: `code` or `no_code`. Do not provide any other words, explanations, or punctuation.
@@ -491,43 +668,15 @@ Follow these rules to make your decision:
 """ 
     
     # --- 2. Extract the most critical context for the decision ---
-    last_user_message = ""
-    last_agent_code = ""
-    last_user_code = ""
-
-    for event in reversed(conversation_history):
-        event_type = event.get('type')
-        author = event.get('author')
-
-        if event_type == 'chat' and author == 'user' and not last_user_message:
-            last_user_message = event.get('content', '')
-        
-        if event_type == 'code':
-            if author == 'agent' and not last_agent_code:
-                last_agent_code = event.get('content', '')
-            elif author == 'user' and not last_user_code:
-                last_user_code = event.get('content', '')
-        
-        # Break early once we have the essential context
-        if last_user_message and last_agent_code and last_user_code:
-            break
+    view = as_conversation_view(conversation_history)
 
     # Provide sensible defaults if items are not found
-    last_agent_code = last_agent_code or "# Agent has not written any code yet."
-    last_user_code = last_user_code or "# User has not written any code yet."
-    last_user_message = last_user_message or "# No user message found in recent history."
+    last_agent_code = view.latest_code("agent") or "# Agent has not written any code yet."
+    last_user_code = view.latest_code("user") or "# User has not written any code yet."
+    last_user_message = view.last_user_message or "# No user message found in recent history."
 
     # --- 3. Build the recent history string for secondary context ---
-    limited_history = conversation_history[-history_limit:]
-    history_log = []
-    for event in limited_history:
-        author = event.get('author', 'system').capitalize()
-        content = event.get('content', '')
-        if event.get('type') == 'chat':
-            history_log.append(f"- {author} says: {content}")
-        elif event.get('type') == 'code':
-            history_log.append(f"- {author}'s code:\n```python\n{content}\n```")
-    history_str = "\n".join(history_log)
+    history_str = _pack_history("routing", view, history_limit, history_token_budget, code_diffs)
 
     # --- 4. Define the Turn Prompt: The Data for THIS Specific Decision ---
     turn_prompt = f"""
@@ -552,32 +701,10 @@ Analyze the following context to decide the next action. Your decision should be
 Based on the rules, should the next step be `code` or `no_code`? Respond with one word only.
 """
 
-    # 5. Prepare the main content payload for the API request.
-    contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part.from_text(text = turn_prompt)],
-            )
-        ]
-
-    # 6. Configure all generation settings for the API call.
-    generate_content_config = types.GenerateContentConfig(
-        thinking_config = types.ThinkingConfig(thinking_budget = 0),
-        system_instruction = system_prompt,
-        temperature = 0,
-        tools = [],
-    )
-    
-    # 7. Send the request to the Gemini model.
-    response = client.models.generate_content(
-        model = model_name,
-        contents = contents,
-        config = generate_content_config
-    )
-
-    response = response.text.strip()
-
-    if response not in ["code", "no_code"]:
-        return "no_code"
-    
-    return response
\ No newline at end of file
+    # 5. Bundle them with the generation settings: no thinking and a fixed
+    #    temperature keep the one-word answer fast and stable.
+    return LLMRequest(kind = "routing",
+                      system_prompt = system_prompt,
+                      prompt = turn_prompt,
+                      temperature = 0,
+                      thinking_budget = 0)
@@ -0,0 +1,447 @@
+# File: backend/utils/agent_tools/llm_backends.py
+import os
+import time
+import random
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional
+
+from google.genai import types
+
+from app import metrics
+
+# ==============================================================================
+# Request / response shapes shared by every provider
+# ==============================================================================
+
+class LLMRequest(NamedTuple):
+    """One prompt, independent of the provider that will answer it."""
+    kind: str                         # "code", "chat" or "routing"
+    system_prompt: str
+    prompt: str
+    temperature: float
+    thinking_budget: int = 0  # Ignored by providers without thinking control
+
+
+class LLMResponse(NamedTuple):
+    text: str
+    model: str    # The provider's model that answered
+    backend: str  # The backend's name
+
+
+class LLMBackend(ABC):
+    """
+    Interface the agents talk to instead of a provider SDK.
+
+    `model` is always the model the caller asked for (e.g. "gemini-2.5-pro");
+    a backend for another provider maps it to one of its own models and
+    reports through supports() whether it can serve it at all.
+    """
+    name = "backend"
+
+    def supports(self, model: str) -> bool:
+        return True
+
+    @abstractmethod
+    def generate(self, model: str, request: LLMRequest) -> LLMResponse:
+        ...
+
+    @abstractmethod
+    async def generate_async(self, model: str, request: LLMRequest) -> LLMResponse:
+        ...
+
+    @abstractmethod
+    def stream(self, model: str, request: LLMRequest) -> Iterator[str]:
+        ...
+
+    @abstractmethod
+    async def stream_async(self, model: str, request: LLMRequest) -> AsyncIterator[str]:
+        ...
+
+
+# ==============================================================================
+# Gemini
+# ==============================================================================
+
+class GeminiBackend(LLMBackend):
+    """google-genai adapter."""
+    name = "gemini"
+
+    def __init__(self, client):
+        self.client = client
+
+    def supports(self, model: str) -> bool:
+        return model.startswith("gemini")
+
+    @staticmethod
+    def _contents(request: LLMRequest):
+        return [types.Content(role = "user", parts = [types.Part.from_text(text = request.prompt)])]
+
+    @staticmethod
+    def _config(request: LLMRequest):
+        # The system prompt is sent inline on every call. Caching the
+        # per-problem system prompts as Gemini cached contents is not worth
+        # it: gemini-2.5-pro only caches 4096+ tokens and these prompts are
+        # ~1.7k (create_code_system_prompt, create_chat_system_prompt), so
+        # every cache creation would fall back to the inline prompt.
+        return types.GenerateContentConfig(
+            system_instruction = request.system_prompt,
+            thinking_config = types.ThinkingConfig(thinking_budget = request.thinking_budget),
+            temperature = request.temperature,
+            tools = [],
+        )
+
+    def generate(self, model: str, request: LLMRequest) -> LLMResponse:
+        response = self.client.models.generate_content(
+            model = model,
+            contents = self._contents(request),
+            config = self._config(request)
+        )
+        return LLMResponse(response.text or "", model, self.name)
+
+    async def generate_async(self, model: str, request: LLMRequest) -> LLMResponse:
+        response = await self.client.aio.models.generate_content(
+            model = model,
+            contents = self._contents(request),
+            config = self._config(request)
+        )
+        return LLMResponse(response.text or "", model, self.name)
+
+    def stream(self, model: str, request: LLMRequest) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(
+            model = model,
+            contents = self._contents(request),
+            config = self._config(request)
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    async def stream_async(self, model: str, request: LLMRequest) -> AsyncIterator[str]:
+        stream = await self.client.aio.models.generate_content_stream(
+            model = model,
+            contents = self._contents(request),
+            config = self._config(request)
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+# ==============================================================================
+# OpenAI
+# ==============================================================================
+
+# Requested (Gemini) model -> OpenAI model. Override with OPENAI_MODEL_MAP,
+# e.g. "gemini-2.5-pro=gpt-4.1,gemini-2.5-flash-lite=gpt-4.1-nano".
+DEFAULT_OPENAI_MODEL_MAP = {
+    "gemini-2.5-pro": "gpt-4.1",
+    "gemini-2.5-flash": "gpt-4.1-mini",
+    "gemini-2.5-flash-lite": "gpt-4.1-nano",
+}
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI Chat Completions adapter (same prompts, sent as a system and a
+    user message). thinking_budget has no equivalent and is ignored.
+    """
+    name = "openai"
+
+    def __init__(self, client = None, async_client = None, models: Dict[str, str] = None):
+        self.client = client
+        self.async_client = async_client
+        self.models = models if models is not None else dict(DEFAULT_OPENAI_MODEL_MAP)
+
+    def supports(self, model: str) -> bool:
+        return model in self.models or model.startswith("gpt")
+
+    def _model(self, model: str) -> str:
+        return self.models.get(model, model)
+
+    @staticmethod
+    def _messages(request: LLMRequest) -> List[Dict[str, Any]]:
+        return [
+            {"role": "system", "content": request.system_prompt},
+            {"role": "user", "content": request.prompt},
+        ]
+
+    def generate(self, model: str, request: LLMRequest) -> LLMResponse:
+        response = self.client.chat.completions.create(
+            model = self._model(model),
+            messages = self._messages(request),
+            temperature = request.temperature
+        )
+        return LLMResponse(response.choices[0].message.content or "", self._model(model), self.name)
+
+    async def generate_async(self, model: str, request: LLMRequest) -> LLMResponse:
+        response = await self.async_client.chat.completions.create(
+            model = self._model(model),
+            messages = self._messages(request),
+            temperature = request.temperature
+        )
+        return LLMResponse(response.choices[0].message.content or "", self._model(model), self.name)
+
+    def stream(self, model: str, request: LLMRequest) -> Iterator[str]:
+        for chunk in self.client.chat.completions.create(
+            model = self._model(model),
+            messages = self._messages(request),
+            temperature = request.temperature,
+            stream = True
+        ):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def stream_async(self, model: str, request: LLMRequest) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            model = self._model(model),
+            messages = self._messages(request),
+            temperature = request.temperature,
+            stream = True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# ==============================================================================
+# Fake (load tests, local development)
+# ==============================================================================
+
+DEFAULT_FAKE_REPLIES = {
+    "routing": "code",
+    "code": "```python\n# Start with 20 stones\nstones = 20  # pretty sure this is right\n```",
+    "chat": "ngl I just changed one line, let's add a print and see what happens 👀",
+}
+
+
+class FakeBackend(LLMBackend):
+    """
+    Answers every request locally after a configurable delay, without any
+    network call. Streams split the reply into `chunks` pieces spread over
+    the same delay.
+    """
+    name = "fake"
+
+    def __init__(self, latency_seconds: float = 0.5, jitter_seconds: float = 0.0,
+                 replies: Dict[str, str] = None, chunks: int = 8, seed: Optional[int] = None):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.replies = {**DEFAULT_FAKE_REPLIES, **(replies or {})}
+        self.chunks = max(1, chunks)
+        self._random = random.Random(seed)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency_seconds + self._random.uniform(-self.jitter_seconds, self.jitter_seconds))
+
+    def _pieces(self, request: LLMRequest) -> List[str]:
+        text = self.replies.get(request.kind, "")
+        size = max(1, -(-len(text) // self.chunks))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate(self, model: str, request: LLMRequest) -> LLMResponse:
+        time.sleep(self._delay())
+        return LLMResponse(self.replies.get(request.kind, ""), model, self.name)
+
+    async def generate_async(self, model: str, request: LLMRequest) -> LLMResponse:
+        await asyncio.sleep(self._delay())
+        return LLMResponse(self.replies.get(request.kind, ""), model, self.name)
+
+    def stream(self, model: str, request: LLMRequest) -> Iterator[str]:
+        pieces = self._pieces(request)
+        for piece in pieces:
+            time.sleep(self._delay() / len(pieces))
+            yield piece
+
+    async def stream_async(self, model: str, request: LLMRequest) -> AsyncIterator[str]:
+        pieces = self._pieces(request)
+        for piece in pieces:
+            await asyncio.sleep(self._delay() / len(pieces))
+            yield piece
+
+
+# ==============================================================================
+# Latency-aware routing between backends
+# ==============================================================================
+
+class LatencyRouter(LLMBackend):
+    """
+    Spreads requests over several backends by observed latency.
+
+    Backends are listed in order of preference. For each request the first
+    backend that supports the model and whose p95 latency for it (over the
+    last `window` calls) meets p95_target_seconds is used; backends without
+    enough samples yet count as meeting it. If none does, the fastest one
+    is used. A backend that fails is skipped for that request (failover);
+    a stream only fails over before its first chunk. Streams are timed to
+    their first chunk.
+    """
+    name = "router"
+
+    def __init__(self, backends: List[LLMBackend], p95_target_seconds: float,
+                 window: int = 200, min_samples: int = 20):
+        self.backends = backends
+        self.p95_target_seconds = p95_target_seconds
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}  # (backend name, model) -> deque of seconds
+
+    def supports(self, model: str) -> bool:
+        return any(backend.supports(model) for backend in self.backends)
+
+    def p95(self, backend: LLMBackend, model: str) -> Optional[float]:
+        samples = self._samples.get((backend.name, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def _record(self, backend: LLMBackend, model: str, seconds: float):
+        samples = self._samples.setdefault((backend.name, model), deque(maxlen = self.window))
+        samples.append(seconds)
+        p95 = self.p95(backend, model)
+        if p95 is not None:
+            metrics.set_gauge(f"llm_backend.{backend.name}.{model}.p95_seconds", round(p95, 3))
+
+    def _ranked(self, model: str) -> List[LLMBackend]:
+        candidates = [backend for backend in self.backends if backend.supports(model)]
+        if not candidates:
+            raise ValueError(f"No LLM backend supports model {model}")
+        within_target = []
+        too_slow = []
+        for backend in candidates:
+            p95 = self.p95(backend, model)
+            if p95 is None or p95 <= self.p95_target_seconds:
+                within_target.append(backend)
+            else:
+                too_slow.append((p95, backend))
+        return within_target + [backend for _, backend in sorted(too_slow, key = lambda item: item[0])]
+
+    def _failed(self, backend: LLMBackend, model: str, seconds: float, error: Exception):
+        # A failure counts as a slow call, so a failing backend drifts down the ranking
+        self._record(backend, model, max(seconds, self.p95_target_seconds * 2))
+        metrics.increment(f"llm_backend.{backend.name}.failovers")
+        print(f"LLM backend {backend.name} failed for {model}: {error}")
+
+    def _selected(self, backend: LLMBackend):
+        metrics.increment(f"llm_backend.{backend.name}.selected")
+
+    def generate(self, model: str, request: LLMRequest) -> LLMResponse:
+        error = None
+        for backend in self._ranked(model):
+            self._selected(backend)
+            started = time.perf_counter()
+            try:
+                response = backend.generate(model, request)
+            except Exception as e:
+                self._failed(backend, model, time.perf_counter() - started, e)
+                error = e
+                continue
+            self._record(backend, model, time.perf_counter() - started)
+            return response
+        raise error
+
+    async def generate_async(self, model: str, request: LLMRequest) -> LLMResponse:
+        error = None
+        for backend in self._ranked(model):
+            self._selected(backend)
+            started = time.perf_counter()
+            try:
+                response = await backend.generate_async(model, request)
+            except Exception as e:
+                self._failed(backend, model, time.perf_counter() - started, e)
+                error = e
+                continue
+            self._record(backend, model, time.perf_counter() - started)
+            return response
+        raise error
+
+    def stream(self, model: str, request: LLMRequest) -> Iterator[str]:
+        error = None
+        for backend in self._ranked(model):
+            self._selected(backend)
+            started = time.perf_counter()
+            first = True
+            try:
+                for text in backend.stream(model, request):
+                    if first:
+                        self._record(backend, model, time.perf_counter() - started)
+                        first = False
+                    yield text
+                return
+            except Exception as e:
+                if not first:
+                    raise
+                self._failed(backend, model, time.perf_counter() - started, e)
+                error = e
+        raise error
+
+    async def stream_async(self, model: str, request: LLMRequest) -> AsyncIterator[str]:
+        error = None
+        for backend in self._ranked(model):
+            self._selected(backend)
+            started = time.perf_counter()
+            first = True
+            try:
+                async for text in backend.stream_async(model, request):
+                    if first:
+                        self._record(backend, model, time.perf_counter() - started)
+                        first = False
+                    yield text
+                return
+            except Exception as e:
+                if not first:
+                    raise
+                self._failed(backend, model, time.perf_counter() - started, e)
+                error = e
+        raise error
+
+
+# ==============================================================================
+# Factory
+# ==============================================================================
+
+def as_llm_backend(client) -> LLMBackend:
+    """Lets the agent functions take either an LLMBackend or a plain genai.Client."""
+    if isinstance(client, LLMBackend):
+        return client
+    return GeminiBackend(client)
+
+
+def _parse_model_map(value: str) -> Dict[str, str]:
+    models = dict(DEFAULT_OPENAI_MODEL_MAP)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        requested, _, mapped = item.partition("=")
+        if mapped:
+            models[requested.strip()] = mapped.strip()
+    return models
+
+
+def create_llm_backend(gemini_client = None) -> LLMBackend:
+    """
+    Builds the backend named by LLM_BACKENDS (comma separated, in order of
+    preference: "gemini", "openai", "fake"). Several backends are combined
+    in a LatencyRouter with LLM_P95_TARGET_SECONDS as its target.
+    """
+    names = [name.strip() for name in os.getenv("LLM_BACKENDS", "gemini").split(",") if name.strip()]
+    backends = []
+    for name in names:
+        if name == "gemini":
+            backends.append(GeminiBackend(gemini_client))
+        elif name == "openai":
+            # Only needed when OpenAI is actually configured
+            from openai import OpenAI, AsyncOpenAI
+            api_key = os.environ.get("OPENAI_API_KEY")
+            backends.append(OpenAIBackend(OpenAI(api_key = api_key), AsyncOpenAI(api_key = api_key),
+                                          _parse_model_map(os.getenv("OPENAI_MODEL_MAP", ""))))
+        elif name == "fake":
+            backends.append(FakeBackend(latency_seconds = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.5")),
+                                        jitter_seconds = float(os.getenv("FAKE_LLM_JITTER_SECONDS", "0"))))
+        else:
+            print(f"Warning: unknown LLM backend '{name}' in LLM_BACKENDS")
+
+    if not backends:
+        backends.append(GeminiBackend(gemini_client))
+    if len(backends) == 1:
+        return backends[0]
+    return LatencyRouter(backends, p95_target_seconds = float(os.getenv("LLM_P95_TARGET_SECONDS", "8")))
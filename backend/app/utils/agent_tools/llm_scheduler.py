@@ -0,0 +1,260 @@
+# File: backend/utils/agent_tools/llm_scheduler.py
+import os
+import time
+import random
+import asyncio
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, AsyncIterator, Optional
+
+from app import metrics
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+# Limits are per gunicorn worker: divide the provider quota by the number of
+# workers. Format: "model=concurrency/requests_per_minute,..." e.g.
+#   LLM_MODEL_LIMITS="gemini-2.5-pro=8/60,gemini-2.5-flash-lite=32/600"
+
+DEFAULT_MODEL_LIMITS = {
+    "gemini-2.5-pro": (8, 60),
+    "gemini-2.5-flash": (16, 250),
+    "gemini-2.5-flash-lite": (32, 600),
+}
+# Models not listed above
+DEFAULT_LIMIT = (8, 60)
+
+# Calls waiting for a slot per model before new ones are turned away
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+# Retries on 429 / 503, with exponential backoff and full jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+RETRYABLE_STATUS_CODES = (429, 503)
+
+
+def _parse_model_limits(value: str) -> dict:
+    limits = dict(DEFAULT_MODEL_LIMITS)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            model, limit = item.split("=")
+            concurrency, per_minute = limit.split("/")
+            limits[model.strip()] = (int(concurrency), float(per_minute))
+        except ValueError:
+            print(f"Warning: ignoring malformed LLM_MODEL_LIMITS entry '{item}'")
+    return limits
+
+
+LLM_MODEL_LIMITS = _parse_model_limits(os.getenv("LLM_MODEL_LIMITS", ""))
+
+
+class LLMRejected(Exception):
+    """The call was not made: the queue is full or the deadline passed."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    # OpenAI/httpx errors expose .status_code; their .code is the error code
+    # string from the body (e.g. "rate_limit_exceeded"). google-genai
+    # APIError has the HTTP status in .code.
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+# ==============================================================================
+# Per-model lane: concurrency cap + token bucket + fair queue
+# ==============================================================================
+
+class _ModelLane:
+    """
+    Admission control for one model.
+
+    A call needs a free concurrency slot and a token from the bucket (refilled
+    at requests_per_minute / 60 per second, bursting up to the concurrency
+    cap). Waiting calls are queued per session and served round-robin across
+    sessions, so one chatty session cannot starve the others.
+    """
+
+    def __init__(self, model: str, max_concurrency: int, requests_per_minute: float):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.rate = requests_per_minute / 60.0
+        self.burst = float(max_concurrency)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self._queues = OrderedDict()  # session key -> deque of futures
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _dispatch(self):
+        self._timer = None
+        while self._queues and self.in_flight < self.max_concurrency:
+            self._refill()
+            if self.tokens < 1:
+                # Wake up when the next token is due
+                delay = (1 - self.tokens) / self.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                break
+
+            session_key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_key)
+            else:
+                del self._queues[session_key]
+            if future.done():  # Cancelled or timed out while queued
+                continue
+
+            self.tokens -= 1
+            self.in_flight += 1
+            future.set_result(None)
+        self._report()
+
+    def _report(self):
+        metrics.set_gauge(f"llm.{self.model}.in_flight", self.in_flight)
+        metrics.set_gauge(f"llm.{self.model}.queue_depth", self.waiting)
+
+    async def acquire(self, session_key, deadline: Optional[float]):
+        if self.waiting >= LLM_MAX_QUEUE:
+            metrics.increment(f"llm.{self.model}.rejected")
+            raise LLMRejected(f"{self.model} queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_key, deque()).append(future)
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            if self._timer is None:
+                self._dispatch()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            metrics.increment(f"llm.{self.model}.deadline_exceeded")
+            raise LLMRejected(f"{self.model} deadline passed while queued")
+        except BaseException:
+            # Cancelled after the slot was granted: give it back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.waiting -= 1
+            metrics.observe(f"llm.{self.model}.queue_wait_seconds", time.perf_counter() - started)
+
+    def release(self):
+        self.in_flight -= 1
+        if self._timer is None:
+            self._dispatch()
+        else:
+            self._report()
+
+
+# ==============================================================================
+# Scheduler
+# ==============================================================================
+
+class LLMScheduler:
+    """
+    Funnels this worker's outbound LLM calls through per-model lanes.
+
+    run() wraps a single request and stream() a streamed one. Both retry
+    429 / 503 answers with jittered exponential backoff (a stream only until
+    its first chunk) and give up with LLMRejected once the caller's deadline
+    (a time.monotonic() value) has passed.
+    """
+
+    def __init__(self, model_limits: dict = None):
+        self.model_limits = model_limits if model_limits is not None else LLM_MODEL_LIMITS
+        self._lanes = {}
+
+    def lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            max_concurrency, per_minute = self.model_limits.get(model, DEFAULT_LIMIT)
+            lane = self._lanes[model] = _ModelLane(model, max_concurrency, per_minute)
+        return lane
+
+    async def _backoff(self, model: str, attempt: int, error: Exception, deadline: Optional[float]):
+        if attempt >= LLM_MAX_RETRIES or _status_code(error) not in RETRYABLE_STATUS_CODES:
+            raise error
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise error
+        metrics.increment(f"llm.{model}.retries")
+        await asyncio.sleep(delay)
+
+    async def run(self, model: str, call: Callable[[], Awaitable], session_key = None,
+                  deadline: Optional[float] = None):
+        """
+        Runs call() (a coroutine factory, called again on every retry) once a
+        slot for model is available, and returns its result.
+        """
+        lane = self.lane(model)
+        attempt = 0
+        while True:
+            await lane.acquire(session_key, deadline)
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                return await asyncio.wait_for(call(), timeout)
+            except asyncio.TimeoutError:
+                if deadline is None or time.monotonic() < deadline:
+                    # Raised by the call itself (SDK / HTTP client timeout)
+                    raise
+                metrics.increment(f"llm.{model}.deadline_exceeded")
+                raise LLMRejected(f"{model} call did not finish before the deadline")
+            except Exception as e:
+                error = e
+            finally:
+                lane.release()
+            await self._backoff(model, attempt, error, deadline)
+            attempt += 1
+
+    async def stream(self, model: str, open_stream: Callable[[], AsyncIterator], session_key = None,
+                     deadline: Optional[float] = None) -> AsyncIterator:
+        """
+        Yields the items of open_stream() (an async generator factory) while
+        holding a slot for model for the whole stream. A stream that has not
+        ended by the deadline, stalled or not, ends with LLMRejected.
+        """
+        lane = self.lane(model)
+        attempt = 0
+        while True:
+            await lane.acquire(session_key, deadline)
+            started = False
+            try:
+                items = open_stream().__aiter__()
+                while True:
+                    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                    try:
+                        item = await asyncio.wait_for(items.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError:
+                        if deadline is None or time.monotonic() < deadline:
+                            # Raised by the stream itself (SDK / HTTP client timeout)
+                            raise
+                        metrics.increment(f"llm.{model}.deadline_exceeded")
+                        raise LLMRejected(f"{model} stream did not finish before the deadline")
+                    started = True
+                    yield item
+            except LLMRejected:
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                error = e
+            finally:
+                lane.release()
+            await self._backoff(model, attempt, error, deadline)
+            attempt += 1
+
+
+# Shared instance used by the chat router
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,115 @@
+# File: backend/utils/agent_tools/route_cache.py
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app import metrics
+from app.utils.agent_tools.conversation_view import ConversationView
+
+# Router decisions remembered per worker
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "4096"))
+
+# ==============================================================================
+# Tier 1: rule table
+# ==============================================================================
+# Whole messages (after normalise_message) whose route is clear from the
+# routing prompt's own rules: approvals to proceed are "code", social or
+# waiting messages are "no_code". Ambiguous ones ("ok", "next") and anything
+# longer or mixed go to tier 2.
+
+_APPROVALS = [
+    "yes", "yeah", "yep", "yup", "sure", "go", "go ahead", "do it", "do that",
+    "yes do that", "yes do it", "ok do it", "okay do it", "ok do that", "okay do that", "try it",
+    "ok try it", "okay try it", "yes try it", "lets try it", "lets do it", "go for it", "sounds good do it",
+    "yes please", "please do", "proceed", "keep going", "implement it",
+]
+_SOCIAL = [
+    "lol", "lmao", "haha", "hahaha", "thanks", "thank you", "thx", "ty", "ok thanks", "okay thanks",
+    "cool", "nice", "great", "awesome", "hi", "hello", "hey", "one moment", "one sec", "wait",
+    "hold on", "brb", "hmm", "idk", "im lost", "i am lost", "i dont get it", "i dont understand",
+    "that didnt work", "it didnt work", "thats wrong", "what", "huh",
+]
+ROUTE_RULES = {
+    **{phrase: "code" for phrase in _APPROVALS},
+    **{phrase: "no_code" for phrase in _SOCIAL},
+}
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalise_message(message: str) -> str:
+    """Lowercases a chat message and strips punctuation, emoji and extra spaces."""
+    return _SPACES.sub(" ", _NON_WORD.sub("", message.lower())).strip()
+
+
+# ==============================================================================
+# Tier 2: decision cache
+# ==============================================================================
+
+class RouteCache:
+    """
+    Skips routing_agent calls whose answer is already known.
+
+    The router runs at temperature 0 without thinking and decides mostly from
+    the last user message and the latest agent and user code, so:
+      1. Short messages in ROUTE_RULES are decided locally.
+      2. Otherwise the decision is looked up in a per-worker LRU keyed on a
+         hash of the normalised message and both latest code snapshots. This
+         catches repeated turns, e.g. many students sending the same first
+         message on the same starter code.
+    Only on a miss does the caller ask the LLM, then store() its answer.
+    """
+
+    def __init__(self, max_entries: int = ROUTE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(view: ConversationView) -> str:
+        digest = hashlib.sha256()
+        for part in (normalise_message(view.last_user_message), view.latest_code("agent"), view.latest_code("user")):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def lookup(self, view: ConversationView) -> Optional[str]:
+        """
+        Returns "code" / "no_code" when the route is known without the LLM,
+        otherwise None.
+        """
+        route = ROUTE_RULES.get(normalise_message(view.last_user_message))
+        if route is not None:
+            metrics.increment("router.rule_hits")
+            metrics.increment("router.calls_avoided")
+            return route
+
+        key = self.key_for(view)
+        with self._lock:
+            route = self._entries.get(key)
+            if route is not None:
+                self._entries.move_to_end(key)
+        if route is not None:
+            metrics.increment("router.cache_hits")
+            metrics.increment("router.calls_avoided")
+            return route
+
+        metrics.increment("router.llm_calls")
+        return None
+
+    def store(self, view: ConversationView, route: str):
+        key = self.key_for(view)
+        with self._lock:
+            self._entries[key] = route
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("router.cache_size", len(self._entries))
+
+
+# Shared instance used by the chat router
+route_cache = RouteCache()
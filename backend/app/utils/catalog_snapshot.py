@@ -0,0 +1,96 @@
+# /backend/app/utils/catalog_snapshot.py
+import os
+import json
+import time
+import asyncio
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, schemas, metrics
+
+# How often a worker asks Postgres whether the catalog changed. In between,
+# the snapshot (and 304s for it) is served without touching the database.
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "2"))
+
+
+class CatalogSnapshot:
+    """
+    In-memory copy of the problem listing, pre-rendered as JSON.
+
+    The snapshot is tagged with the catalog_version counter it was built from.
+    Uploads bump that counter in the same transaction as the new problem, so
+    every gunicorn worker notices the change at its next version check (at
+    most CATALOG_VERSION_CHECK_SECONDS later) and rebuilds its snapshot. The
+    worker that handled the upload rebuilds on its next request.
+    """
+
+    def __init__(self, check_seconds: float = CATALOG_VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        # (version, {"full": bytes, "summary": bytes}), replaced atomically
+        self._state = (None, {})
+        self._checked_at = 0.0
+        self._async_lock = asyncio.Lock()
+
+    @staticmethod
+    def etag_for(version) -> str:
+        return f'"catalog-{version}"'
+
+    def current(self):
+        """
+        Returns (version, bodies) if the snapshot is recent enough to be served
+        without asking Postgres, otherwise None.
+        """
+        version, bodies = self._state
+        if version is None or time.monotonic() - self._checked_at > self.check_seconds:
+            return None
+        return version, bodies
+
+    async def get_async(self, db: AsyncSession):
+        """
+        Returns (version, bodies), first checking the version row if the last
+        check is too old and rebuilding if the catalog changed.
+        """
+        state = self.current()
+        if state is not None:
+            metrics.increment("catalog_snapshot.hits")
+            return state
+
+        async with self._async_lock:
+            state = self.current()
+            if state is not None:
+                metrics.increment("catalog_snapshot.hits")
+                return state
+
+            current_version = await crud.get_catalog_version_async(db)
+            if current_version != self._state[0]:
+                started = time.perf_counter()
+                problems, _ = await crud.list_problems_async(db)
+                summaries, _ = await crud.list_problems_async(db, summary=True)
+                self._render(current_version, problems, summaries, started)
+            else:
+                metrics.increment("catalog_snapshot.hits")
+            self._checked_at = time.monotonic()
+            return self._state
+
+    def _render(self, version: int, problems, summaries, started: float):
+        # Render once; every request for this version reuses the same bytes
+        bodies = {
+            "full": json.dumps(jsonable_encoder([schemas.Problem.model_validate(p) for p in problems])).encode("utf-8"),
+            "summary": json.dumps(jsonable_encoder([schemas.ProblemSummary.model_validate(p) for p in summaries])).encode("utf-8"),
+        }
+        self._state = (version, bodies)
+        metrics.increment("catalog_snapshot.rebuilds")
+        metrics.set_gauge("catalog_snapshot.version", version)
+        metrics.observe("catalog_snapshot.rebuild_seconds", time.perf_counter() - started)
+
+    def invalidate(self):
+        """
+        Forces a version check on the next request (used after an upload).
+        """
+        self._state = (None, {})
+        self._checked_at = 0.0
+
+
+# Shared instance used by the problems router
+catalog_snapshot = CatalogSnapshot()
@@ -0,0 +1,173 @@
+# /backend/app/utils/event_recorder.py
+import os
+import time
+import uuid
+import asyncio
+from collections import deque
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+
+from app import crud, models, metrics
+from app.database import engine
+
+# Flush as soon as this many rows are waiting...
+EVENT_RECORDER_BATCH_SIZE = int(os.getenv("EVENT_RECORDER_BATCH_SIZE", "200"))
+# ...or when the oldest waiting row is this old
+EVENT_RECORDER_FLUSH_SECONDS = float(os.getenv("EVENT_RECORDER_FLUSH_SECONDS", "0.5"))
+# Callers wait (backpressure) once this many rows are queued
+EVENT_RECORDER_MAX_QUEUE = int(os.getenv("EVENT_RECORDER_MAX_QUEUE", "5000"))
+# Attempts per batch before it is dropped
+EVENT_RECORDER_MAX_RETRIES = 3
+
+
+class EventRecorder:
+    """
+    Write-behind recorder for session_messages.
+
+    Chat, code and output events are queued in memory and written by a
+    background task in multi-row INSERTs, so a chat turn never waits for its
+    own commit. Each gunicorn worker runs its own recorder. Rows queued or
+    being written are still visible through pending_events(), so the session
+    history of this worker never misses them.
+    """
+
+    def __init__(self,
+                 batch_size: int = EVENT_RECORDER_BATCH_SIZE,
+                 flush_seconds: float = EVENT_RECORDER_FLUSH_SECONDS,
+                 max_queue: int = EVENT_RECORDER_MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._in_flight = []
+        self._task = None
+        # Created in start(), on the event loop that will use them
+        self._wake = None
+        self._drained = None
+        self._flush_lock = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the background task and writes everything still queued.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def record(self, session_id: UUID, events: list):
+        """
+        Queues conversation events for a session. Waits if the queue is full.
+        Returns the timestamp given to the last event (None if there were none).
+        """
+        rows = crud.session_message_rows(session_id, events)
+        if not rows:
+            return None
+        for row in rows:
+            row["message_id"] = uuid.uuid4()
+
+        if not self.running:
+            # No background task (scripts, one-off tools): write right away
+            await run_in_threadpool(self._write_rows, rows)
+            return rows[-1]["timestamp"]
+
+        # Backpressure: let the flusher catch up before queueing more
+        while self._queue and len(self._queue) + len(rows) > self.max_queue:
+            metrics.increment("event_recorder.backpressure_waits")
+            self._drained.clear()
+            self._wake.set()
+            await self._drained.wait()
+
+        self._queue.extend(rows)
+        metrics.set_gauge("event_recorder.queue_depth", len(self._queue))
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+        return rows[-1]["timestamp"]
+
+    def pending_events(self, session_id: UUID, stored_ids = ()) -> list:
+        """
+        Events of a session that are queued or being written, in order.
+
+        A batch stays in flight until its write returns, a moment after its
+        commit is visible: pass the message_ids already read from the
+        database as stored_ids, so those rows are not returned twice.
+        """
+        return [
+            {"author": row["sender"], "type": row["message_type"].value.lower(), "content": row["content"]}
+            for row in [*self._in_flight, *self._queue]
+            if row["session_id"] == session_id and row["message_id"] not in stored_ids
+        ]
+
+    def latest_pending(self, session_id: UUID):
+        """
+        Timestamp of the newest queued or in-flight row of a session, or None.
+        """
+        return max((row["timestamp"] for row in [*self._in_flight, *self._queue]
+                    if row["session_id"] == session_id), default=None)
+
+    async def flush(self):
+        """
+        Writes everything queued so far, batch by batch.
+        """
+        async with self._flush_lock:
+            while self._queue:
+                count = min(self.batch_size, len(self._queue))
+                self._in_flight = [self._queue.popleft() for _ in range(count)]
+                metrics.set_gauge("event_recorder.queue_depth", len(self._queue))
+                await self._write_with_retries(self._in_flight)
+                self._in_flight = []
+            self._drained.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Never let the flusher die; the rows stay queued for the next round
+                print(f"Event recorder flush error: {e}")
+
+    async def _write_with_retries(self, rows: list):
+        for attempt in range(1, EVENT_RECORDER_MAX_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                await run_in_threadpool(self._write_rows, rows)
+                metrics.observe("event_recorder.flush_seconds", time.perf_counter() - started)
+                metrics.increment("event_recorder.rows_written", len(rows))
+                return
+            except Exception as e:
+                metrics.increment("event_recorder.flush_failures")
+                print(f"Event recorder: failed to write {len(rows)} rows (attempt {attempt}): {e}")
+                await asyncio.sleep(0.1 * attempt)
+        metrics.increment("event_recorder.rows_dropped", len(rows))
+
+    @staticmethod
+    def _write_rows(rows: list):
+        # One multi-row INSERT ... VALUES (...), (...) per batch
+        with engine.begin() as connection:
+            connection.execute(insert(models.SessionMessage.__table__).values(rows))
+
+
+# Shared instance, started and stopped by the app's lifespan
+event_recorder = EventRecorder()
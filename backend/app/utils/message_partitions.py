@@ -0,0 +1,170 @@
+# /backend/app/utils/message_partitions.py
+import os
+import re
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from app import metrics
+from app.database import engine
+
+# Monthly partitions kept created ahead of the current month
+SESSION_MESSAGES_PARTITIONS_AHEAD = int(os.getenv("SESSION_MESSAGES_PARTITIONS_AHEAD", "3"))
+# Months of messages kept attached, counting the current one; older partitions
+# are detached for archival (0 = keep everything)
+SESSION_MESSAGES_RETENTION_MONTHS = int(os.getenv("SESSION_MESSAGES_RETENTION_MONTHS", "0"))
+# How often each worker runs the maintenance
+SESSION_MESSAGES_MAINTENANCE_SECONDS = float(os.getenv("SESSION_MESSAGES_MAINTENANCE_SECONDS", "21600"))
+# Give up on a partition DDL rather than queue the chat writes behind its lock
+MAINTENANCE_LOCK_TIMEOUT = "5s"
+# Advisory lock key, so only one worker runs the maintenance at a time
+MAINTENANCE_ADVISORY_LOCK = 720331
+
+PARENT_TABLE = "session_messages"
+DEFAULT_PARTITION = "session_messages_default"
+PARTITION_NAME = re.compile(r"^session_messages_p(\d{4})_(\d{2})$")
+
+
+def month_start(moment: datetime, offset: int = 0) -> datetime:
+    """First instant (UTC) of the month of moment, moved by offset months."""
+    moment = moment.astimezone(timezone.utc)
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_p{month:%Y_%m}"
+
+
+def is_partition_table(name: str) -> bool:
+    """
+    True for the tables this module manages (attached or detached), which
+    alembic autogenerate must not try to drop.
+    """
+    return name == DEFAULT_PARTITION or PARTITION_NAME.match(name) is not None
+
+
+def attached_partitions(connection) -> list:
+    return connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT_TABLE}).scalars().all()
+
+
+def create_partition(connection, month: datetime):
+    """
+    Creates the partition of one month. Rows of that month that already
+    landed in the default partition are moved into it, since PostgreSQL
+    refuses to create a partition whose rows sit in the default one.
+    """
+    lower, upper = month, month_start(month, 1)
+    bounds = f"FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    name = partition_name(month)
+    stray = connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper)"
+    ), {"lower": lower, "upper": upper}).scalar()
+
+    if not stray:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES {bounds}"))
+        return
+
+    print(f"Moving {month:%Y-%m} session messages out of {DEFAULT_PARTITION}")
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES {bounds}"))
+    range_filter = {"lower": lower, "upper": upper}
+    connection.execute(text(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper"
+    ), range_filter)
+    connection.execute(text(
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper"
+    ), range_filter)
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def maintain_partitions(now: datetime = None,
+                        months_ahead: int = SESSION_MESSAGES_PARTITIONS_AHEAD,
+                        retention_months: int = SESSION_MESSAGES_RETENTION_MONTHS) -> dict:
+    """
+    Creates the partitions of the current month and the next months_ahead,
+    and detaches the partitions older than retention_months.
+
+    Detached partitions stay in the database as plain tables with the same
+    name, out of every query on session_messages; archive them
+    (pg_dump -t session_messages_p2026_01) and drop them when convenient.
+
+    Returns {"created": [...], "detached": [...]} (both empty if another
+    worker holds the maintenance lock).
+    """
+    now = now or datetime.now(timezone.utc)
+    created, detached = [], []
+    with engine.begin() as connection:
+        if not connection.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                                  {"key": MAINTENANCE_ADVISORY_LOCK}).scalar():
+            return {"created": created, "detached": detached}
+        connection.execute(text(f"SET LOCAL lock_timeout = '{MAINTENANCE_LOCK_TIMEOUT}'"))
+
+        attached = set(attached_partitions(connection))
+        for offset in range(months_ahead + 1):
+            month = month_start(now, offset)
+            if partition_name(month) not in attached:
+                create_partition(connection, month)
+                created.append(partition_name(month))
+
+        if retention_months > 0:
+            cutoff = month_start(now, 1 - retention_months)
+            for name in sorted(attached):
+                match = PARTITION_NAME.match(name)
+                if match and datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc) < cutoff:
+                    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                    detached.append(name)
+
+    for name in created:
+        print(f"Created partition {name}")
+    for name in detached:
+        print(f"Detached partition {name} (past the {retention_months} month retention)")
+    metrics.increment("message_partitions.created", len(created))
+    metrics.increment("message_partitions.detached", len(detached))
+    return {"created": created, "detached": detached}
+
+
+class PartitionMaintainer:
+    """
+    Runs maintain_partitions() at startup and then every interval_seconds,
+    so next month's partition always exists before its first message is
+    written. Every worker runs one; the advisory lock lets a single worker
+    do the work.
+    """
+
+    def __init__(self, interval_seconds: float = SESSION_MESSAGES_MAINTENANCE_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_in_threadpool(maintain_partitions)
+            except Exception as e:
+                # Messages of a missing month go to the default partition meanwhile
+                metrics.increment("message_partitions.failures")
+                print(f"Session message partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+# Shared instance, started and stopped by the app's lifespan
+partition_maintainer = PartitionMaintainer()
@@ -1,16 +1,192 @@
 # /backend/utils/parse_problem.py
 import os
 import glob
+import hashlib
 import frontmatter
 import re
+import bisect
 from typing import Union
 from fastapi import UploadFile
 
 PROBLEMS_DIR = "problems"
 
+# Bump this whenever parse_problem_content changes its output, so problems
+# pre-parsed at upload time are re-parsed by the backfill script.
+# 2: re-parse rows stored by the first tokenizer, which missed section
+#    markers that were not at the start of a line.
+PARSER_VERSION = 2
+
+# Precompiled patterns used by the section tokenizer
+_MILESTONE_RE = re.compile(r"\*\*Milestone (\d+)\*\*")
+_WHITESPACE_RE = re.compile(r"\s*")
+_WORD_RE = re.compile(r"\w*")
+
+def _find_all(text: str, token: str):
+    """
+    Yields the position of every (possibly overlapping) occurrence of token.
+    """
+    position = text.find(token)
+    while position != -1:
+        yield position
+        position = text.find(token, position + 1)
+
+def _tokenize_problem(content: str) -> dict:
+    """
+    Walks the document once, line by line, and indexes everything the section
+    lookups need: heading lines (lines starting with '#', where sections end),
+    every '**Milestone' marker and every '```' fence, each as an offset into
+    content. Section starts are found with str.find, since the previous
+    regexes matched them anywhere in a line.
+    """
+    headings = []
+    milestone_marks = []
+    fences = []
+
+    offset = 0
+    for line in content.split("\n"):
+        if line.startswith("#"):
+            headings.append((offset, line))
+        if "**Milestone" in line:
+            milestone_marks.extend(offset + position for position in _find_all(line, "**Milestone"))
+        if "```" in line:
+            fences.extend(offset + position for position in _find_all(line, "```"))
+        offset += len(line) + 1
+
+    return {"headings": headings, "milestone_marks": milestone_marks, "fences": fences}
+
+def _find_heading(headings, prefix: str, after: int = -1):
+    """
+    Returns the offset of the first heading line that starts with prefix and
+    begins after the given offset, or -1 if there is none.
+    """
+    for offset, line in headings:
+        if offset > after and line.startswith(prefix):
+            return offset
+    return -1
+
+def _next_at_or_after(offsets, position: int) -> int:
+    """
+    Returns the first offset >= position in a sorted list, or -1.
+    """
+    index = bisect.bisect_left(offsets, position)
+    return offsets[index] if index < len(offsets) else -1
+
+def _section_between(content: str, headings, start_heading: str, end_heading: str, include_start: bool = False) -> str:
+    """
+    Text from the first occurrence of start_heading (anywhere, like the
+    regexes this replaced) up to the next line starting with end_heading.
+    Empty if either is missing.
+    """
+    start = content.find(start_heading)
+    if start == -1:
+        return ""
+    end = _find_heading(headings, end_heading, after=start + len(start_heading) - 1)
+    if end == -1:
+        return ""
+    body_start = start if include_start else start + len(start_heading)
+    return content[body_start:end].strip()
+
+def _fenced_block(content: str, fences, position: int) -> str:
+    """
+    Text from position (just after an opening fence and its info string) up
+    to the next '```'. Returns None if the block never closes.
+    """
+    position = _WHITESPACE_RE.match(content, position).end()
+    closing = _next_at_or_after(fences, position)
+    if closing == -1:
+        return None
+    return content[position:closing].strip()
+
+def _code_block(content: str, tokens: dict, heading: str) -> str:
+    """
+    The first ```python block after the first occurrence of heading.
+    """
+    start = content.find(heading)
+    if start == -1:
+        return ""
+    for fence in tokens["fences"]:
+        if fence > start and content.startswith("```python", fence):
+            block = _fenced_block(content, tokens["fences"], fence + len("```python"))
+            return block if block is not None else ""
+    return ""
+
+def _example_output(content: str, tokens: dict) -> str:
+    """
+    The fenced block that directly follows a '## Example output' heading.
+    """
+    for offset, line in tokens["headings"]:
+        if not line.startswith("## Example output"):
+            continue
+        position = offset + len("## Example output")
+        if content.startswith(":", position):
+            position += 1
+        position = _WHITESPACE_RE.match(content, position).end()
+        if not content.startswith("```", position):
+            continue
+        # Skip the fence and its optional language tag
+        block = _fenced_block(content, tokens["fences"], _WORD_RE.match(content, position + 3).end())
+        if block is not None:
+            return block
+    return ""
+
+def _description_block(content: str, headings) -> str:
+    """
+    Everything under the first '## Description' followed by whitespace, up
+    to the next line starting with '## '.
+    """
+    for position in _find_all(content, "## Description"):
+        start = position + len("## Description")
+        body_start = _WHITESPACE_RE.match(content, start).end()
+        if body_start == start:
+            # '## Descriptions' or similar, not the section we want
+            continue
+        end = len(content)
+        for heading_offset, heading_line in headings:
+            if heading_offset >= body_start and heading_line.startswith("## "):
+                end = heading_offset
+                break
+        return content[body_start:end].strip()
+    return ""
+
+def _milestones(content: str, tokens: dict) -> list:
+    """
+    Every '**Milestone N**' with its text, up to the next milestone marker,
+    the next '##' heading or the end of the document.
+    """
+    heading_breaks = [offset - 1 for offset, line in tokens["headings"] if line.startswith("##") and offset > 0]
+    marks = tokens["milestone_marks"]
+
+    milestones = []
+    scan_from = 0
+    for mark in marks:
+        if mark < scan_from:
+            continue
+        milestone_match = _MILESTONE_RE.match(content, mark)
+        if not milestone_match:
+            continue
+        body_start = milestone_match.end()
+        candidates = [
+            _next_at_or_after(marks, body_start),
+            _next_at_or_after(heading_breaks, body_start),
+        ]
+        end = min([candidate for candidate in candidates if candidate != -1], default=len(content))
+        milestones.append({ "number": int(milestone_match.group(1)), "content": content[body_start:end].strip() })
+        scan_from = end
+    return milestones
+
+def _split_list_section(section: str) -> list:
+    """
+    Turns a '- item,\n- item' markdown list into a list of items.
+    """
+    return section.replace("- ", "").replace(", \n", ",\n").split(",\n", maxsplit = -1)
+
 def parse_problem_content(content: str, metadata: dict = None):
     """
     Enhanced parser for markdown content with frontmatter + structured problem sections.
+
+    The document is tokenized once (see _tokenize_problem) and every section
+    is then cut out of that index, instead of rescanning the whole document
+    with one regex per section.
     """
 
     # Extract frontmatter metadata if not provided
@@ -19,45 +195,12 @@ def parse_problem_content(content: str, metadata: dict = None):
         metadata = post.metadata
         content = post.content
 
-    # Extract Problem Statement
-    match = re.search(r"(# Problem Statement.*?)^## Evaluation", content, re.DOTALL | re.MULTILINE)
-    problem_statement = match.group(1).strip() if match else ""
-
-    # Extract Lesson Goals
-    match = re.search(r"## Lesson Goals(.*?)^## Common Mistakes", content, re.DOTALL | re.MULTILINE)
-    lesson_goals = match.group(1).strip() if match else ""
-    lesson_goals = lesson_goals.replace("- ", "").replace(", \n", ",\n").split(",\n", maxsplit = -1)
-
-    # Extract Common Mistakes
-    match = re.search(r"## Common Mistakes(.*?)^## Suggested Answer", content, re.DOTALL | re.MULTILINE)
-    common_mistakes = match.group(1).strip() if match else ""
-    common_mistakes = common_mistakes.replace("- ", "").replace(", \n", ",\n").split(",\n", maxsplit = -1)
+    tokens = _tokenize_problem(content)
+    headings = tokens["headings"]
 
-    # Extract Description Block under ## Description
-    description_match = re.search(r"## Description\s+([\s\S]*?)(^## |\Z)", content, re.MULTILINE)
-    description_block = description_match.group(1).strip() if description_match else ""
-
-    # Extract all Milestones
-    milestones = []
-    milestone_pattern = re.compile(
-        r"\*\*Milestone (\d+)\*\*([\s\S]*?)(?=\*\*Milestone|\n##|\Z)", re.MULTILINE
-    )
-    for milestone_match in milestone_pattern.finditer(content):
-        milestone_number = milestone_match.group(1)
-        milestone_content = milestone_match.group(2).strip()
-        milestones.append({ "number": int(milestone_number), "content": milestone_content })
-
-    # Extract Example Output block
-    match = re.search(r"^## Example output:?\s*```(?:\w+)?\s*([\s\S]*?)```", content, re.MULTILINE)
-    example_output = match.group(1).strip() if match else ""
-
-    # Extract user input block
-    match = re.search(r"## User Input[\s\S]*?```python\s*([\s\S]*?)```", content)
-    user_code = match.group(1).strip() if match else ""
-
-    # Extract agent input block
-    match = re.search(r"## Agent Input[\s\S]*?```python\s*([\s\S]*?)```", content)
-    agent_code = match.group(1).strip() if match else ""
+    problem_statement = _section_between(content, headings, "# Problem Statement", "## Evaluation", include_start=True)
+    lesson_goals = _split_list_section(_section_between(content, headings, "## Lesson Goals", "## Common Mistakes"))
+    common_mistakes = _split_list_section(_section_between(content, headings, "## Common Mistakes", "## Suggested Answer"))
 
     return {
         "title": metadata.get("title", ""),
@@ -68,13 +211,25 @@ def parse_problem_content(content: str, metadata: dict = None):
         "problem_statement": problem_statement,
         "lesson_goals": lesson_goals,
         "common_mistakes": common_mistakes,
-        "description_block": description_block,
-        "milestones": milestones,
-        "example_output": example_output,
-        "agent_code": agent_code,
-        "user_code": user_code,
+        "description_block": _description_block(content, headings),
+        "milestones": _milestones(content, tokens),
+        "example_output": _example_output(content, tokens),
+        "agent_code": _code_block(content, tokens, "## Agent Input"),
+        "user_code": _code_block(content, tokens, "## User Input"),
     }
 
+def parse_problem_markdown(markdown_content: str):
+    """
+    Parses a full problem file (frontmatter + body) once.
+
+    Returns a (metadata, parsed_data, content_hash) tuple, where content_hash is
+    the SHA-256 of the raw markdown and identifies the exact content parsed.
+    """
+    post = frontmatter.loads(markdown_content)
+    parsed_data = parse_problem_content(post.content, post.metadata)
+    content_hash = hashlib.sha256(markdown_content.encode('utf-8')).hexdigest()
+    return post.metadata, parsed_data, content_hash
+
 def load_problem(problem_id: str):
     """
     Load a problem from disk by ID (filename without .md extension).
@@ -0,0 +1,90 @@
+# /backend/app/utils/problem_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from app import metrics
+
+# Maximum number of parsed problems kept per worker
+PROBLEM_CACHE_MAX_ENTRIES = int(os.getenv("PROBLEM_CACHE_MAX_ENTRIES", "256"))
+# How long an entry is trusted before it is revalidated against GCS. Uploads
+# invalidate the worker that handled them immediately; the other workers pick
+# up the change at their next revalidation.
+PROBLEM_CACHE_TTL_SECONDS = float(os.getenv("PROBLEM_CACHE_TTL_SECONDS", "300"))
+
+
+class ProblemCache:
+    """
+    A size-bounded LRU cache of fully built ProblemDetail responses.
+
+    Entries are keyed by problem_id and remember the GCS blob generation they
+    were built from, so an expired entry can be revalidated against the
+    file's current generation instead of being rebuilt.
+    """
+
+    def __init__(self, max_entries: int = PROBLEM_CACHE_MAX_ENTRIES, ttl_seconds: float = PROBLEM_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, problem_id):
+        """
+        Returns a copy of the entry for problem_id, including expired ones, so
+        the caller can revalidate it against GCS instead of re-downloading.
+        The returned dict has "detail", "generation" and "stale".
+        """
+        key = str(problem_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return {
+                **entry,
+                "stale": time.monotonic() - entry["cached_at"] > self.ttl_seconds,
+            }
+
+    def refresh(self, problem_id):
+        """
+        Marks an entry as fresh again after GCS confirmed its generation is current.
+        """
+        with self._lock:
+            entry = self._entries.get(str(problem_id))
+            if entry is not None:
+                entry["cached_at"] = time.monotonic()
+                metrics.increment("problem_cache.revalidations")
+
+    def put(self, problem_id, detail, generation=None):
+        """
+        Stores a ProblemDetail, evicting the least recently used entry if full.
+        """
+        key = str(problem_id)
+        with self._lock:
+            self._entries[key] = {
+                "detail": detail,
+                "generation": generation,
+                "cached_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("problem_cache.evictions")
+            metrics.set_gauge("problem_cache.size", len(self._entries))
+
+    def invalidate(self, problem_id=None):
+        """
+        Drops a single problem, or the whole cache when problem_id is None.
+        """
+        with self._lock:
+            if problem_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(problem_id), None)
+            metrics.increment("problem_cache.invalidations")
+            metrics.set_gauge("problem_cache.size", len(self._entries))
+
+
+# Shared instance used by the problems router
+problem_cache = ProblemCache()
@@ -0,0 +1,177 @@
+# /backend/app/utils/problem_store.py
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.utils.parse_problem import PROBLEMS_DIR
+
+# Which backend holds the problem markdown files: "gcs" (default) or "local"
+PROBLEM_STORE = os.getenv("PROBLEM_STORE", "gcs").lower()
+GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+# Directory used by the local store. Defaults to the same folder load_problem reads.
+LOCAL_PROBLEMS_DIR = os.getenv("LOCAL_PROBLEMS_DIR", PROBLEMS_DIR)
+
+
+class ProblemFileNotFound(Exception):
+    """Raised when a problem file does not exist in the store."""
+
+
+class ProblemStore(ABC):
+    """
+    Interface for wherever the problem markdown files live.
+
+    All methods are async so endpoints never block the event loop on storage.
+    A "generation" is an opaque value that changes every time a file is
+    rewritten; callers use it to decide whether cached parses are still valid.
+    """
+
+    @abstractmethod
+    async def stat(self, path: str) -> dict:
+        """
+        Returns {"generation": ...} for a file without
+        reading its content. Raises ProblemFileNotFound if it does not exist.
+        """
+
+    @abstractmethod
+    async def read(self, path: str, generation=None) -> tuple:
+        """
+        Returns (content, generation) for a file. If generation is given, the
+        content is guaranteed to belong to that generation or a newer one
+        whose generation is returned instead.
+        """
+
+    @abstractmethod
+    async def write(self, path: str, content_bytes: bytes):
+        """
+        Creates or replaces a file and returns its new generation.
+        """
+
+
+# ==============================================================================
+# Google Cloud Storage
+# ==============================================================================
+
+class GCSProblemStore(ProblemStore):
+    """
+    Problem files stored in a GCS bucket. The google-cloud-storage client is
+    synchronous, so every call is offloaded to the threadpool.
+    """
+
+    def __init__(self, bucket_name: str):
+        from google.cloud import storage
+
+        self.storage_client = storage.Client()
+        self.bucket = self.storage_client.bucket(bucket_name)
+
+    def _stat(self, path: str) -> dict:
+        blob = self.bucket.get_blob(path)
+        if blob is None:
+            raise ProblemFileNotFound(path)
+        return {"generation": blob.generation}
+
+    def _read(self, path: str, generation=None) -> tuple:
+        from google.api_core import exceptions
+
+        blob = self.bucket.blob(path)
+        try:
+            if generation is None:
+                content = blob.download_as_text()
+                return content, blob.generation
+            try:
+                return blob.download_as_text(if_generation_match=generation), generation
+            except exceptions.PreconditionFailed:
+                # The file was replaced between the caller's stat and this download
+                blob.reload()
+                return blob.download_as_text(if_generation_match=blob.generation), blob.generation
+        except exceptions.NotFound:
+            raise ProblemFileNotFound(path)
+
+    def _write(self, path: str, content_bytes: bytes):
+        blob = self.bucket.blob(path)
+        blob.upload_from_string(content_bytes, content_type='text/markdown')
+        return blob.generation
+
+    async def stat(self, path: str) -> dict:
+        return await run_in_threadpool(self._stat, path)
+
+    async def read(self, path: str, generation=None) -> tuple:
+        return await run_in_threadpool(self._read, path, generation)
+
+    async def write(self, path: str, content_bytes: bytes):
+        return await run_in_threadpool(self._write, path, content_bytes)
+
+
+# ==============================================================================
+# Local filesystem
+# ==============================================================================
+
+class LocalProblemStore(ProblemStore):
+    """
+    Problem files stored on disk, in the same PROBLEMS_DIR layout used by
+    load_problem. Database file paths look like "problems/<file>.md", so only
+    the file name is used to locate the file under the root directory.
+    The file's modification time (in ns) acts as its generation.
+    """
+
+    def __init__(self, root: str = LOCAL_PROBLEMS_DIR):
+        self.root = root
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, os.path.basename(path))
+
+    def _stat(self, path: str) -> dict:
+        try:
+            generation = os.stat(self._path(path)).st_mtime_ns
+        except FileNotFoundError:
+            raise ProblemFileNotFound(path)
+        return {"generation": generation}
+
+    def _read(self, path: str, generation=None) -> tuple:
+        full_path = self._path(path)
+        try:
+            with open(full_path, 'r', encoding='utf-8') as file:
+                content = file.read()
+                current_generation = os.fstat(file.fileno()).st_mtime_ns
+        except FileNotFoundError:
+            raise ProblemFileNotFound(path)
+        return content, current_generation
+
+    def _write(self, path: str, content_bytes: bytes):
+        os.makedirs(self.root, exist_ok=True)
+        full_path = self._path(path)
+        # Write to a temporary file first so readers never see a partial file
+        tmp_path = f"{full_path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(content_bytes)
+        os.replace(tmp_path, full_path)
+        return os.stat(full_path).st_mtime_ns
+
+    async def stat(self, path: str) -> dict:
+        return await run_in_threadpool(self._stat, path)
+
+    async def read(self, path: str, generation=None) -> tuple:
+        return await run_in_threadpool(self._read, path, generation)
+
+    async def write(self, path: str, content_bytes: bytes):
+        return await run_in_threadpool(self._write, path, content_bytes)
+
+
+def create_problem_store() -> Optional[ProblemStore]:
+    """
+    Builds the store selected by the PROBLEM_STORE environment variable.
+    Returns None if it cannot be initialized, so the app can still start.
+    """
+    try:
+        if PROBLEM_STORE == "local":
+            return LocalProblemStore()
+        if PROBLEM_STORE == "gcs":
+            if not GCS_BUCKET_NAME:
+                raise ValueError("GCS_BUCKET_NAME environment variable is not set.")
+            return GCSProblemStore(GCS_BUCKET_NAME)
+        raise ValueError(f"Unknown PROBLEM_STORE '{PROBLEM_STORE}'. Use 'gcs' or 'local'.")
+    except Exception as e:
+        # Endpoints that need the store will fail gracefully.
+        print(f"Warning: Could not initialize problem store. {e}")
+        return None
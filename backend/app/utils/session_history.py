@@ -0,0 +1,122 @@
+# /backend/app/utils/session_history.py
+import os
+import threading
+from collections import OrderedDict
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, metrics
+from app.utils.event_recorder import event_recorder
+from app.utils.agent_tools.conversation_view import ConversationView
+
+# Number of sessions whose history is kept in memory per worker
+SESSION_HISTORY_CACHE_MAX = int(os.getenv("SESSION_HISTORY_CACHE_MAX", "1024"))
+
+
+def _history_view(session_id: UUID, messages: list) -> tuple:
+    """
+    The stored messages followed by the events this worker has queued but not
+    written yet (pending rows read back from the database are skipped), and
+    the timestamp of the newest of them.
+    """
+    stored_ids = {message_id for message_id, *_ in messages}
+    history = ConversationView.from_history(
+        crud.as_events(messages) + event_recorder.pending_events(session_id, stored_ids)
+    )
+    timestamps = [messages[-1][-1]] if messages else []
+    pending = event_recorder.latest_pending(session_id)
+    if pending is not None:
+        timestamps.append(pending)
+    return history, max(timestamps, default=None)
+
+
+class SessionHistoryCache:
+    """
+    Per-worker LRU cache of conversation histories, keyed by session_id.
+    Each history is held as a ConversationView, so the rendered prompt window
+    carries over from one turn to the next instead of being rebuilt.
+
+    Each entry also remembers the session's user, so a session is only
+    served to its owner, and the timestamp of the newest message it holds.
+
+    Lets /api/chat accept only the new events of a turn instead of the whole
+    conversation_history. On a miss, or when the session has a stored
+    message newer than the entry's (another worker served the session), the
+    history is rebuilt from the session_messages table.
+
+    The cache can be stale: messages another worker has queued but not
+    written yet (up to EVENT_RECORDER_FLUSH_SECONDS) cannot be seen. If this
+    worker serves the next turn in that window, those messages stay missing
+    from its entry, since they are older than its own, until the entry is
+    rebuilt (evicted, or invalidated after a failed turn).
+    """
+
+    def __init__(self, max_entries: int = SESSION_HISTORY_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get_async(self, db: AsyncSession, session_id: UUID, user_id: str):
+        """
+        Returns the session's ConversationView (the caller may append to it),
+        or None if the session does not exist or belongs to another user.
+        """
+        key = str(session_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry = dict(entry)
+
+        if entry is not None:
+            if entry["user_id"] != user_id:
+                return None
+            # Our own messages may still be queued in the event recorder; a
+            # stored message newer than what we hold came from another worker
+            latest = await crud.latest_session_message_async(db, session_id)
+            if latest is None or (entry["latest"] is not None and latest <= entry["latest"]):
+                metrics.increment("session_history.hits")
+                return entry["history"]
+
+        metrics.increment("session_history.misses")
+        if entry is None:
+            session = await crud.get_session_async(db, session_id)
+            if session is None or session.user_id != user_id:
+                return None
+
+        # Events this worker queued but has not written yet come last
+        history, latest = _history_view(session_id, await crud.get_session_messages_async(db, session_id))
+        self.put(session_id, history, user_id, latest)
+        return history
+
+    def put(self, session_id: UUID, history: ConversationView, user_id: str, latest=None):
+        key = str(session_id)
+        with self._lock:
+            self._entries[key] = {"history": history, "user_id": user_id, "latest": latest}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("session_history.size", len(self._entries))
+
+    def recorded(self, session_id: UUID, timestamp):
+        """
+        Notes that this worker queued the session's messages up to timestamp
+        (the value EventRecorder.record returned), so they do not look like
+        another worker's on the next turn.
+        """
+        if timestamp is None:
+            return
+        with self._lock:
+            entry = self._entries.get(str(session_id))
+            if entry is not None and (entry["latest"] is None or timestamp > entry["latest"]):
+                entry["latest"] = timestamp
+
+    def invalidate(self, session_id: UUID):
+        with self._lock:
+            self._entries.pop(str(session_id), None)
+            metrics.set_gauge("session_history.size", len(self._entries))
+
+
+# Shared instance used by the chat router
+session_history = SessionHistoryCache()
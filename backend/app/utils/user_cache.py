@@ -0,0 +1,56 @@
+# /backend/app/utils/user_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from app import metrics
+
+# Maximum number of users remembered per worker
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# How long a user seen in the database is trusted without asking it again
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+
+class UserCache:
+    """
+    A size-bounded LRU cache of users known to exist, keyed by user_id.
+
+    The login call (/api/users/) only needs to know the user row exists and
+    return it, so within the TTL a repeated login (page reloads, several
+    tabs) is answered without touching the database.
+    """
+
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str):
+        """
+        Returns the cached schemas.User for user_id, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry["cached_at"] <= self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                metrics.increment("user_cache.hits")
+                return entry["user"]
+        metrics.increment("user_cache.misses")
+        return None
+
+    def put(self, user):
+        """
+        Stores a schemas.User, evicting the least recently used entry if full.
+        """
+        with self._lock:
+            self._entries[user.user_id] = {"user": user, "cached_at": time.monotonic()}
+            self._entries.move_to_end(user.user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge("user_cache.size", len(self._entries))
+
+
+# Shared instance used by the users router
+user_cache = UserCache()
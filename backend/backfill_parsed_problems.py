@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Script to pre-parse problems that were uploaded before parsing moved to upload time.
+For every problem without parsed content (or parsed by an older PARSER_VERSION),
+it reads the markdown file from the problem store, parses it once and stores the
+result in the problems table.
+
+Usage (inside the backend container):
+    python backfill_parsed_problems.py          # only missing/outdated problems
+    python backfill_parsed_problems.py --all    # re-parse every problem
+"""
+
+import sys
+import asyncio
+from sqlalchemy import or_
+
+from app.database import SessionLocal
+from app import models
+from app.utils.parse_problem import parse_problem_markdown, PARSER_VERSION
+from app.utils.problem_store import create_problem_store, ProblemFileNotFound
+
+print("--- Backfill Parsed Problems Script ---")
+
+
+async def backfill(reparse_all: bool = False) -> int:
+    problem_store = create_problem_store()
+    if problem_store is None:
+        print("❌ Problem store not initialized. Check PROBLEM_STORE / GCS_BUCKET_NAME.")
+        return 1
+
+    db = SessionLocal()
+    failures = 0
+    try:
+        query = db.query(models.Problem)
+        if not reparse_all:
+            query = query.filter(or_(
+                models.Problem.parsed_content.is_(None),
+                models.Problem.parser_version.is_(None),
+                models.Problem.parser_version != PARSER_VERSION,
+            ))
+        problems = query.all()
+        print(f"Found {len(problems)} problems to parse (parser version {PARSER_VERSION}).")
+
+        for problem in problems:
+            try:
+                markdown_content, _ = await problem_store.read(problem.file_path)
+                _, parsed_data, content_hash = parse_problem_markdown(markdown_content)
+
+                problem.parsed_content = parsed_data
+                problem.content_hash = content_hash
+                problem.parser_version = PARSER_VERSION
+                # Commit one by one so a bad file does not undo the others
+                db.commit()
+                print(f"✅ {problem.title} ({problem.problem_id})")
+            except ProblemFileNotFound:
+                db.rollback()
+                failures += 1
+                print(f"⚠️  {problem.title} ({problem.problem_id}): file '{problem.file_path}' not found in problem store.")
+            except Exception as e:
+                db.rollback()
+                failures += 1
+                print(f"⚠️  {problem.title} ({problem.problem_id}): {type(e).__name__}: {e}")
+    finally:
+        db.close()
+
+    if failures:
+        print(f"\n❌ Finished with {failures} failures.")
+        return 1
+    print("\n✅ Backfill complete.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(backfill(reparse_all="--all" in sys.argv[1:])))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for parse_problem_content.
+
+Compares the single-pass section tokenizer in app/utils/parse_problem.py with
+the previous implementation (one regex search per section, copied below) on
+synthetic problems from 1 KB to 1 MB.
+
+Before timing, it checks both return the same dict on the problems in
+/problems, the synthetic problems and --random randomized documents built
+from section markers in odd places (mid-line, repeated, unclosed fences...).
+
+Usage (from the backend folder):
+    python benchmarks/bench_parse_problem.py [--random 20000] [--seed 0]
+"""
+
+import re
+import sys
+import glob
+import random
+import timeit
+import argparse
+from os.path import abspath, dirname, join
+
+import frontmatter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from app.utils.parse_problem import parse_problem_content
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+PROBLEMS_GLOB = join(dirname(dirname(dirname(abspath(__file__)))), "problems", "*.md")
+
+# Pieces the randomized documents are made of
+MARKERS = [
+    "# Problem Statement", "## Evaluation", "## Lesson Goals", "## Common Mistakes", "## Suggested Answer",
+    "## Description", "## Descriptions", "## Example output", "## Example output:", "## User Input",
+    "## Agent Input", "## Task", "**Milestone 1**", "**Milestone 22**", "**Milestone x**", "**Milestone",
+    "```", "````", "```python", "```text", "---", "#",
+]
+FILLERS = ["", " ", "  ", "text ", " inline", "- goal, ", "- item,", "stones -= 1", ":", "\t", "\n"]
+METADATA = {"title": "Synthetic", "description": "Synthetic problem", "difficulty": "Easy", "tags": ["python"], "author": "bench"}
+
+
+def legacy_parse_problem_content(content: str, metadata: dict):
+    """
+    The regex cascade parse_problem_content used before the section tokenizer.
+    """
+    match = re.search(r"(# Problem Statement.*?)^## Evaluation", content, re.DOTALL | re.MULTILINE)
+    problem_statement = match.group(1).strip() if match else ""
+
+    match = re.search(r"## Lesson Goals(.*?)^## Common Mistakes", content, re.DOTALL | re.MULTILINE)
+    lesson_goals = match.group(1).strip() if match else ""
+    lesson_goals = lesson_goals.replace("- ", "").replace(", \n", ",\n").split(",\n", maxsplit = -1)
+
+    match = re.search(r"## Common Mistakes(.*?)^## Suggested Answer", content, re.DOTALL | re.MULTILINE)
+    common_mistakes = match.group(1).strip() if match else ""
+    common_mistakes = common_mistakes.replace("- ", "").replace(", \n", ",\n").split(",\n", maxsplit = -1)
+
+    description_match = re.search(r"## Description\s+([\s\S]*?)(^## |\Z)", content, re.MULTILINE)
+    description_block = description_match.group(1).strip() if description_match else ""
+
+    milestones = []
+    milestone_pattern = re.compile(
+        r"\*\*Milestone (\d+)\*\*([\s\S]*?)(?=\*\*Milestone|\n##|\Z)", re.MULTILINE
+    )
+    for milestone_match in milestone_pattern.finditer(content):
+        milestones.append({ "number": int(milestone_match.group(1)), "content": milestone_match.group(2).strip() })
+
+    match = re.search(r"^## Example output:?\s*```(?:\w+)?\s*([\s\S]*?)```", content, re.MULTILINE)
+    example_output = match.group(1).strip() if match else ""
+
+    match = re.search(r"## User Input[\s\S]*?```python\s*([\s\S]*?)```", content)
+    user_code = match.group(1).strip() if match else ""
+
+    match = re.search(r"## Agent Input[\s\S]*?```python\s*([\s\S]*?)```", content)
+    agent_code = match.group(1).strip() if match else ""
+
+    return {
+        "title": metadata.get("title", ""),
+        "description_meta": metadata.get("description", ""),
+        "difficulty": metadata.get("difficulty", ""),
+        "tags": metadata.get("tags", []),
+        "author": metadata.get("author", ""),
+        "problem_statement": problem_statement,
+        "lesson_goals": lesson_goals,
+        "common_mistakes": common_mistakes,
+        "description_block": description_block,
+        "milestones": milestones,
+        "example_output": example_output,
+        "agent_code": agent_code,
+        "user_code": user_code,
+    }
+
+
+def make_synthetic_problem(target_bytes: int) -> str:
+    """
+    Builds a problem following the template in /problems, growing every
+    section in proportion until the document reaches target_bytes.
+    """
+    scale = max(1, target_bytes // 1_000)
+    description = "\n\n".join(f"Paragraph {i}: players alternate taking stones until none are left." for i in range(scale))
+    milestones = "\n\n".join(f"**Milestone {i + 1}**\n{i + 1}. Do step {i + 1} of the game.\n  - Print the stones left." for i in range(scale))
+    goals = ", \n".join(f"- lesson goal number {i}" for i in range(scale))
+    mistakes = ", \n".join(f"- common mistake number {i}" for i in range(scale))
+    answer = "\n".join(f"stones -= {i % 3}  # step {i}" for i in range(scale))
+    example = "\n".join(f"There are {i} stones left" for i in range(scale))
+
+    document = f"""
+# Problem Statement
+## Description
+{description}
+
+## Task
+
+{milestones}
+
+## Example output:
+```
+{example}
+```
+
+## Evaluation
+
+## Lesson Goals
+
+{goals}
+
+## Common Mistakes
+
+{mistakes}
+
+## Suggested Answer
+```python
+{answer}
+```
+
+---
+# Interface
+
+## User Input
+```python
+# Start your code here :D
+
+```
+
+## Agent Input
+```python
+# Start with 20 stones
+stones == 20
+
+```"""
+    # Pad the description to land close to the requested size
+    padding = max(0, target_bytes - len(document))
+    return document.replace("## Task", "x" * padding + "\n\n## Task", 1)
+
+
+def make_random_problem(rng: random.Random) -> str:
+    """
+    A random document of markers and fillers, glued with or without line
+    breaks so markers also land mid-line and next to each other.
+    """
+    parts = []
+    for _ in range(rng.randint(1, 40)):
+        parts.append(rng.choice(MARKERS) if rng.random() < 0.6 else rng.choice(FILLERS))
+        parts.append(rng.choice(["\n", "\n", "\n\n", " ", ""]))
+    return "".join(parts)
+
+
+def check_equivalence(args) -> int:
+    """
+    Returns the number of documents on which the two parsers disagree.
+    """
+    documents = [(path, frontmatter.load(path).content) for path in sorted(glob.glob(PROBLEMS_GLOB))]
+    documents += [(f"synthetic {size} bytes", make_synthetic_problem(size)) for size in SIZES]
+    rng = random.Random(args.seed)
+    documents += [(f"random #{i}", make_random_problem(rng)) for i in range(args.random)]
+
+    failures = 0
+    for name, content in documents:
+        expected = legacy_parse_problem_content(content, METADATA)
+        actual = parse_problem_content(content, METADATA)
+        if actual != expected:
+            failures += 1
+            if failures <= 3:
+                fields = [key for key in expected if expected[key] != actual[key]]
+                print(f"❌ Parsers disagree on {name} ({', '.join(fields)}): {content!r}")
+    print(f"Checked {len(documents)} documents, {failures} disagreements\n")
+    return failures
+
+
+def time_parser(parser, content: str) -> float:
+    number, _ = timeit.Timer(lambda: parser(content, METADATA)).autorange()
+    best = min(timeit.repeat(lambda: parser(content, METADATA), number=number, repeat=3))
+    return best / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--random", type = int, default = 20000, help = "Randomized documents to compare (default 20000)")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed of the randomized documents (default 0)")
+    args = parser.parse_args()
+
+    if check_equivalence(args):
+        sys.exit(1)
+
+    print(f"{'size':>10} | {'legacy (ms)':>12} | {'tokenizer (ms)':>14} | {'speedup':>8}")
+    print("-" * 54)
+    for size in SIZES:
+        content = make_synthetic_problem(size)
+        legacy_seconds = time_parser(legacy_parse_problem_content, content)
+        tokenizer_seconds = time_parser(parse_problem_content, content)
+        print(f"{len(content):>10} | {legacy_seconds * 1000:>12.3f} | {tokenizer_seconds * 1000:>14.3f} | {legacy_seconds / tokenizer_seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
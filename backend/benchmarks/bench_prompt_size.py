@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Prompt size benchmark for diff-based code snapshots.
+
+Replays chat sessions turn by turn and builds the code, chat and routing turn
+prompts twice: with every code snapshot in full (the default) and with older
+snapshots rendered as diffs (CHAT_PROMPT_CODE_DIFFS). Reports the estimated
+prompt tokens and build time of both.
+
+Sessions come from, in order of preference:
+  --sessions FILE   a JSON file with a list of conversation histories, or an
+                    object mapping session ids to histories
+  --database        the session_messages table (uses DATABASE_URL)
+  otherwise         synthetic sessions where the agent changes one line per turn
+
+Usage (from the backend folder):
+    python benchmarks/bench_prompt_size.py [--sessions recorded.json | --database] [--limit 50]
+"""
+
+import sys
+import json
+import asyncio
+import random
+import argparse
+import statistics
+import time
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from app.utils.agent_tools.conversation_view import ConversationView, estimate_tokens
+from app.utils.agent_tools.gemini_agent import create_code_turn_prompt, create_chat_turn_prompt, _build_routing_request
+
+# Same limits as routers/chat.py
+CODE_HISTORY_LIMIT = 15
+CHAT_HISTORY_LIMIT = 15
+ROUTING_HISTORY_LIMIT = 10
+
+
+def make_synthetic_session(turns: int, code_lines: int, seed: int) -> list:
+    """
+    A session where the agent adds or edits one line per turn (its own rules)
+    and the user occasionally edits a few lines of their copy.
+    """
+    rng = random.Random(seed)
+    agent_code = [f"value_{i} = compute({i})  # step {i}" for i in range(code_lines)]
+    user_code = list(agent_code)
+    history = [
+        {"author": "agent", "type": "code", "content": "\n".join(agent_code)},
+        {"author": "user", "type": "code", "content": "\n".join(user_code)},
+    ]
+    for turn in range(turns):
+        if rng.random() < 0.3:
+            index = rng.randrange(len(user_code))
+            user_code[index] = f"value_{index} = compute({index}) + {turn}  # user fix"
+            history.append({"author": "user", "type": "code", "content": "\n".join(user_code)})
+        history.append({"author": "user", "type": "chat", "content": f"Could you fix the loop on line {turn % code_lines}? I think it is off by one."})
+        if rng.random() < 0.7:
+            if rng.random() < 0.5:
+                agent_code.insert(rng.randrange(len(agent_code)), f"total += value_{turn}  # surely this is right")
+            else:
+                agent_code[rng.randrange(len(agent_code))] = f"result = value_{turn} * 2  # doubling makes sense"
+            history.append({"author": "agent", "type": "code", "content": "\n".join(agent_code)})
+        history.append({"author": "agent", "type": "chat", "content": "ngl I think it works now, let's add a print and see 👀"})
+    return history
+
+
+async def load_database_sessions(limit: int) -> list:
+    from sqlalchemy import select
+    from app import crud, models
+    from app.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        session_ids = (await db.scalars(select(models.Session.session_id).limit(limit))).all()
+        return [crud.as_events(await crud.get_session_messages_async(db, session_id)) for session_id in session_ids]
+
+
+def load_sessions(args) -> list:
+    if args.sessions:
+        with open(args.sessions) as f:
+            data = json.load(f)
+        return list(data.values()) if isinstance(data, dict) else data
+
+    if args.database:
+        from dotenv import load_dotenv
+        load_dotenv()
+        return asyncio.run(load_database_sessions(args.limit))
+
+    return [make_synthetic_session(turns = 30, code_lines = 60, seed = seed) for seed in range(args.limit)]
+
+
+def build_turn_prompts(history: list, code_diffs: bool) -> int:
+    """
+    Builds the three turn prompts before every user message, as /api/chat
+    would, and returns their total estimated tokens.
+    """
+    view = ConversationView()
+    tokens = 0
+    for event in history:
+        view.append(event)
+        if event.get("type") != "chat" or event.get("author") != "user":
+            continue
+        prompts = [
+            create_code_turn_prompt("", view, CODE_HISTORY_LIMIT, code_diffs = code_diffs),
+            create_chat_turn_prompt(view, "", CHAT_HISTORY_LIMIT, code_diffs = code_diffs),
+            _build_routing_request(view, ROUTING_HISTORY_LIMIT, code_diffs = code_diffs).prompt,
+        ]
+        tokens += sum(estimate_tokens(prompt) for prompt in prompts)
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", help = "JSON file with recorded conversation histories")
+    parser.add_argument("--database", action = "store_true", help = "Read sessions from session_messages")
+    parser.add_argument("--limit", type = int, default = 50, help = "Number of sessions (default 50)")
+    args = parser.parse_args()
+
+    sessions = [history for history in load_sessions(args) if history][:args.limit]
+    if not sessions:
+        print("No sessions to replay")
+        sys.exit(1)
+
+    results = {}
+    for code_diffs in (False, True):
+        started = time.perf_counter()
+        per_session = [build_turn_prompts(history, code_diffs) for history in sessions]
+        results[code_diffs] = (per_session, time.perf_counter() - started)
+
+    full, full_seconds = results[False]
+    diffs, diff_seconds = results[True]
+    turns = sum(1 for history in sessions for e in history if e.get("type") == "chat" and e.get("author") == "user")
+    print(f"{len(sessions)} sessions, {turns} user turns (code + chat + routing prompt per turn)\n")
+    print(f"{'':>22} | {'full snapshots':>14} | {'diffs':>10} | {'saved':>7}")
+    print("-" * 62)
+    print(f"{'tokens / turn (avg)':>22} | {sum(full) / turns:>14.0f} | {sum(diffs) / turns:>10.0f} | {1 - sum(diffs) / sum(full):>6.1%}")
+    print(f"{'tokens / session (p50)':>22} | {statistics.median(full):>14.0f} | {statistics.median(diffs):>10.0f} |")
+    print(f"{'tokens / session (max)':>22} | {max(full):>14.0f} | {max(diffs):>10.0f} |")
+    print(f"{'build time / turn (ms)':>22} | {full_seconds / turns * 1000:>14.3f} | {diff_seconds / turns * 1000:>10.3f} |")
+
+
+if __name__ == "__main__":
+    main()
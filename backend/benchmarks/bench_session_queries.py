@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Query benchmark for the session table indexes (migration b6d0e4a93c75).
+
+Seeds users, problems, sessions, session messages, attempts and test case
+results (all tagged "bench", so they can be removed with --cleanup), then
+times the access paths the app and the session analytics use with
+EXPLAIN ANALYZE: once with the migration's indexes dropped (inside a
+transaction that is rolled back) and once with them. Reports the median
+execution time, the scan each plan uses and the most session_messages
+partitions a run had to read (see migration d3a81f6c5b20).
+
+Run it against a scratch database migrated to head (uses the POSTGRES_* /
+DB_* variables, like the app):
+
+Usage (from the backend folder):
+    python benchmarks/bench_session_queries.py [--sessions 20000] [--messages 50] [--samples 20]
+    python benchmarks/bench_session_queries.py --cleanup
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import importlib.util
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import text
+from app.database import engine
+
+BACKEND_DIR = dirname(dirname(abspath(__file__)))
+MIGRATION = join(BACKEND_DIR, "alembic", "versions", "b6d0e4a93c75_session_access_path_indexes.py")
+
+# A session's messages, bounded like crud._session_messages_filter so that only
+# the partitions from its start to now are scanned
+SESSION_MESSAGES = (
+    "session_id = :session_id AND timestamp < now() + interval '1 day' AND timestamp >= "
+    "(SELECT start_time - interval '1 day' FROM sessions WHERE session_id = :session_id)"
+)
+
+# (label, SQL, parameter it needs)
+QUERIES = [
+    ("messages of a session, in order",
+     f"SELECT sender, message_type, content FROM session_messages WHERE {SESSION_MESSAGES} ORDER BY timestamp",
+     "session_id"),
+    ("newest message of a session",
+     f"SELECT timestamp FROM session_messages WHERE {SESSION_MESSAGES} ORDER BY timestamp DESC LIMIT 1",
+     "session_id"),
+    ("latest sessions of a user",
+     "SELECT * FROM sessions WHERE user_id = :user_id ORDER BY start_time DESC LIMIT 20",
+     "user_id"),
+    ("sessions of a problem, last 7 days",
+     "SELECT count(*) FROM sessions WHERE problem_id = :problem_id AND start_time > now() - interval '7 days'",
+     "problem_id"),
+    ("attempts of a session, in order",
+     "SELECT * FROM attempts WHERE session_id = :session_id ORDER BY submitted_at",
+     "session_id"),
+    ("results of an attempt",
+     "SELECT * FROM test_case_results WHERE attempt_id = :attempt_id",
+     "attempt_id"),
+    ("messages of the last hour",
+     "SELECT count(*) FROM session_messages WHERE timestamp > now() - interval '1 hour'",
+     None),
+]
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (user_id, email, name)
+    SELECT 'bench|' || i, 'bench' || i || '@example.com', 'Bench ' || i
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO problems (problem_id, title, file_path)
+    SELECT gen_random_uuid(), 'Bench problem ' || i, 'bench/' || i || '.md'
+    FROM generate_series(1, :problems) AS i
+    """,
+    """
+    WITH bench_problems AS (
+        SELECT array_agg(problem_id) AS ids FROM problems WHERE file_path LIKE 'bench/%'
+    )
+    INSERT INTO sessions (session_id, problem_id, user_id, start_time)
+    SELECT gen_random_uuid(), ids[1 + i % array_length(ids, 1)], 'bench|' || (1 + i % :users),
+           now() - random() * interval '90 days'
+    FROM bench_problems, generate_series(1, :sessions) AS i
+    """,
+    # Inserted in timestamp order, the way the event recorder appends them
+    """
+    INSERT INTO session_messages (message_id, session_id, sender, content, timestamp, message_type)
+    SELECT gen_random_uuid(), s.session_id,
+           CASE WHEN m % 2 = 0 THEN 'user' ELSE 'agent' END,
+           repeat('print(stones)  # bench ', 10),
+           s.start_time + m * interval '20 seconds',
+           (ARRAY['CHAT', 'CODE', 'OUTPUT'])[1 + m % 3]::messagetype
+    FROM sessions AS s, generate_series(1, :messages) AS m
+    WHERE s.user_id LIKE 'bench|%'
+    ORDER BY 5
+    """,
+    """
+    INSERT INTO attempts (attempt_id, session_id, score, time_taken_seconds, submitted_at)
+    SELECT gen_random_uuid(), s.session_id, (random() * 100)::int, 300 * a, s.start_time + a * interval '5 minutes'
+    FROM sessions AS s, generate_series(1, 3) AS a
+    WHERE s.user_id LIKE 'bench|%'
+    ORDER BY 5
+    """,
+    """
+    INSERT INTO test_case_results (result_id, attempt_id, passed)
+    SELECT gen_random_uuid(), a.attempt_id, random() < 0.5
+    FROM attempts AS a JOIN sessions AS s USING (session_id), generate_series(1, 5)
+    WHERE s.user_id LIKE 'bench|%'
+    """,
+]
+
+CLEANUP_STATEMENTS = [
+    "DELETE FROM test_case_results WHERE attempt_id IN "
+    "(SELECT attempt_id FROM attempts JOIN sessions USING (session_id) WHERE user_id LIKE 'bench|%')",
+    "DELETE FROM attempts WHERE session_id IN (SELECT session_id FROM sessions WHERE user_id LIKE 'bench|%')",
+    "DELETE FROM session_messages WHERE session_id IN (SELECT session_id FROM sessions WHERE user_id LIKE 'bench|%')",
+    "DELETE FROM sessions WHERE user_id LIKE 'bench|%'",
+    "DELETE FROM problems WHERE file_path LIKE 'bench/%'",
+    "DELETE FROM users WHERE user_id LIKE 'bench|%'",
+]
+
+
+def migration_index_names() -> list:
+    spec = importlib.util.spec_from_file_location("session_access_path_indexes", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return [name for name, *_ in migration.NEW_INDEXES]
+
+
+def seed(args):
+    with engine.begin() as connection:
+        if connection.execute(text("SELECT count(*) FROM sessions WHERE user_id LIKE 'bench|%'")).scalar():
+            print("Bench rows already present (use --cleanup to start over)")
+            return
+        print(f"Seeding {args.sessions} sessions x {args.messages} messages...")
+        params = {"users": args.users, "problems": args.problems, "sessions": args.sessions, "messages": args.messages}
+        for statement in SEED_STATEMENTS:
+            connection.execute(text(statement), params)
+    # VACUUM also summarizes the new page ranges of the BRIN index
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE"))
+
+
+def cleanup():
+    with engine.begin() as connection:
+        for statement in CLEANUP_STATEMENTS:
+            connection.execute(text(statement))
+    print("Bench rows removed")
+
+
+def sample_parameters(connection, samples: int) -> dict:
+    def column(sql):
+        return [row[0] for row in connection.execute(text(sql), {"samples": samples})]
+    return {
+        "session_id": column("SELECT session_id FROM sessions WHERE user_id LIKE 'bench|%' ORDER BY random() LIMIT :samples"),
+        "user_id": column("SELECT user_id FROM users WHERE user_id LIKE 'bench|%' ORDER BY random() LIMIT :samples"),
+        "problem_id": column("SELECT problem_id FROM problems WHERE file_path LIKE 'bench/%' ORDER BY random() LIMIT :samples"),
+        "attempt_id": column("SELECT attempt_id FROM attempts JOIN sessions USING (session_id) "
+                             "WHERE user_id LIKE 'bench|%' ORDER BY random() LIMIT :samples"),
+    }
+
+
+def scan_types(plan: dict) -> set:
+    """Scan nodes of an EXPLAIN (FORMAT JSON) plan, e.g. {"Index Scan"}."""
+    found = {plan["Node Type"]} if "Scan" in plan["Node Type"] else set()
+    for child in plan.get("Plans", []):
+        found |= scan_types(child)
+    return found
+
+
+def scanned_partitions(plan: dict) -> set:
+    """session_messages partitions an EXPLAIN ANALYZE plan actually read."""
+    found = set()
+    if plan.get("Relation Name", "").startswith("session_messages_") and plan.get("Actual Loops"):
+        found.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found |= scanned_partitions(child)
+    return found
+
+
+def time_queries(connection, parameters: dict, samples: int) -> dict:
+    results = {}
+    for label, sql, parameter in QUERIES:
+        values = parameters[parameter] if parameter else [None] * samples
+        timings = []
+        scans = set()
+        partitions = []
+        for value in values:
+            explain = connection.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"),
+                                         {parameter: value} if parameter else {}).scalar()
+            explain = explain if isinstance(explain, list) else json.loads(explain)
+            timings.append(explain[0]["Execution Time"])
+            scans |= scan_types(explain[0]["Plan"])
+            partitions.append(len(scanned_partitions(explain[0]["Plan"])))
+        results[label] = (statistics.median(timings), ", ".join(sorted(scans)), max(partitions))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type = int, default = 2000, help = "Seeded users (default 2000)")
+    parser.add_argument("--problems", type = int, default = 20, help = "Seeded problems (default 20)")
+    parser.add_argument("--sessions", type = int, default = 20000, help = "Seeded sessions (default 20000)")
+    parser.add_argument("--messages", type = int, default = 50, help = "Messages per seeded session (default 50)")
+    parser.add_argument("--samples", type = int, default = 20, help = "Runs per query, each with another id (default 20)")
+    parser.add_argument("--cleanup", action = "store_true", help = "Remove the seeded rows and exit")
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup()
+        return
+
+    seed(args)
+    index_names = migration_index_names()
+
+    with engine.connect() as connection:
+        parameters = sample_parameters(connection, args.samples)
+        connection.rollback()
+        if not parameters["session_id"]:
+            print("No bench sessions found")
+            sys.exit(1)
+
+        # Without the indexes: drop them in a transaction and roll it back
+        transaction = connection.begin()
+        for name in index_names:
+            connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        without = time_queries(connection, parameters, args.samples)
+        transaction.rollback()
+
+        with connection.begin():
+            with_indexes = time_queries(connection, parameters, args.samples)
+
+    print(f"\n{'query':>36} | {'no index (ms)':>13} | {'indexed (ms)':>12} | {'speedup':>8} | {'partitions':>10} | plan (indexed)")
+    print("-" * 123)
+    for label, *_ in QUERIES:
+        before, *_ = without[label]
+        after, scans, partitions = with_indexes[label]
+        print(f"{label:>36} | {before:>13.3f} | {after:>12.3f} | {before / after if after else float('inf'):>7.1f}x | "
+              f"{partitions:>10} | {scans}")
+
+
+if __name__ == "__main__":
+    main()
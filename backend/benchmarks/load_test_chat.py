@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the /api/chat pipeline.
+
+Boots the FastAPI app in this process with the agents answered by a
+FakeBackend (see app/utils/agent_tools/llm_backends.py): canned replies
+after a configurable latency, so no API quota is used. Conversation traces
+are replayed turn by turn by --concurrency simulated students, each sending
+the legacy payload (the full history up to its message) for every user chat
+message of a trace. No database is needed.
+
+Reports p50/p95/p99 latency per turn (and time to the first token with
+--stream), throughput, errors and the lag of the event loop the app runs on,
+plus the scheduler and router counters from app.metrics.
+
+Traces come from, in order of preference:
+  --traces FILE   JSON with a list of histories (or an object mapping session
+                  ids to histories), or JSONL with one history or one
+                  /api/chat payload per line. Histories may use the app's
+                  events ({"author", "type", "content"}) or OpenAI-style
+                  messages ({"role", "content"}, as in
+                  scripts/interaction_test.ipynb)
+  otherwise       the synthetic sessions of bench_prompt_size.py
+
+With --url the same traces are sent to a running server instead (start it
+with LLM_BACKENDS=fake); this needs httpx, and the event loop lag is then
+the load generator's, not the server's.
+
+Usage (from the backend folder):
+    python benchmarks/load_test_chat.py [--traces traces.jsonl] [--concurrency 50] [--latency 0.5] [--stream]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# The Gemini client is still created at import time; it is never called
+os.environ.setdefault("GEMINI_API_KEY", "load-test")
+
+from bench_prompt_size import make_synthetic_session
+
+LAG_INTERVAL_SECONDS = 0.01
+REPORTED_METRICS = ("llm.", "router.", "prompt.chat.history_tokens", "chat.")
+
+
+# ==============================================================================
+# Traces
+# ==============================================================================
+
+def as_event(item: dict) -> dict:
+    """Converts an OpenAI-style message to an app event; app events pass through."""
+    if "author" in item:
+        return item
+    author = "agent" if item.get("role") == "assistant" else "user"
+    return {"author": author, "type": "chat", "content": item.get("content", "")}
+
+
+def as_history(item) -> list:
+    messages = item.get("messages", []) if isinstance(item, dict) else item
+    return [as_event(m) for m in messages if isinstance(m, dict) and m.get("role") != "system"]
+
+
+def load_traces(args) -> list:
+    """
+    Returns a list of traces, each a list of /api/chat payloads sent one
+    after the other by the same student.
+    """
+    if args.traces:
+        with open(args.traces) as f:
+            if args.traces.endswith(".jsonl"):
+                items = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
+                items = list(data.values()) if isinstance(data, dict) else data
+    else:
+        items = [make_synthetic_session(turns = args.turns, code_lines = 40, seed = seed) for seed in range(args.sessions)]
+
+    traces = []
+    for item in items:
+        if isinstance(item, dict) and "conversation_history" in item:
+            # A recorded payload is a one-turn trace
+            traces.append([item])
+            continue
+        history = as_history(item)
+        turns = [
+            {
+                "problem_statement": args.problem_statement,
+                "lesson_goals": [],
+                "common_mistakes": [],
+                "conversation_history": history[:i + 1],
+            }
+            for i, event in enumerate(history)
+            if event.get("author") == "user" and event.get("type") == "chat"
+        ]
+        if turns:
+            traces.append(turns)
+    return traces[:args.sessions]
+
+
+# ==============================================================================
+# Transports
+# ==============================================================================
+
+class InProcessClient:
+    """
+    Calls the ASGI app directly, timing the first body chunk that carries a
+    chat token (httpx's ASGITransport would buffer the whole stream).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def post(self, path: str, payload: dict):
+        body = json.dumps(payload).encode()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": [(b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+        }
+        sent = False
+        status = None
+        first_token = None
+        chunks = []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()  # Never disconnects
+
+        async def send(message):
+            nonlocal status, first_token
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if first_token is None and b"event: token" in chunk:
+                    first_token = time.perf_counter()
+                chunks.append(chunk)
+
+        await self.app(scope, receive, send)
+        return status, first_token, b"".join(chunks)
+
+    async def close(self):
+        pass
+
+
+class HTTPClient:
+    """Sends the payloads to a running server."""
+
+    def __init__(self, url: str, concurrency: int):
+        import httpx
+        self.client = httpx.AsyncClient(base_url = url, timeout = None,
+                                        limits = httpx.Limits(max_connections = concurrency))
+
+    async def post(self, path: str, payload: dict):
+        first_token = None
+        chunks = []
+        async with self.client.stream("POST", path, json = payload) as response:
+            async for chunk in response.aiter_bytes():
+                if first_token is None and b"event: token" in chunk:
+                    first_token = time.perf_counter()
+                chunks.append(chunk)
+        return response.status_code, first_token, b"".join(chunks)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# ==============================================================================
+# Load generation
+# ==============================================================================
+
+async def monitor_loop_lag(samples: list, stop: asyncio.Event):
+    """Records how late a short sleep wakes up, i.e. how long the loop was busy."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL_SECONDS)
+        samples.append(time.perf_counter() - started - LAG_INTERVAL_SECONDS)
+
+
+async def student(client, path: str, queue: asyncio.Queue, results: list, think_seconds: float):
+    while True:
+        try:
+            trace = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        for payload in trace:
+            started = time.perf_counter()
+            try:
+                status, first_token, body = await client.post(path, payload)
+                failed = status != 200 or b"event: error" in body
+            except Exception as e:
+                print("Request failed:", e)
+                status, first_token, failed = None, None, True
+            finished = time.perf_counter()
+            results.append({
+                "status": status,
+                "failed": failed,
+                "seconds": finished - started,
+                "first_token_seconds": first_token - started if first_token else None,
+            })
+            if think_seconds:
+                await asyncio.sleep(think_seconds)
+
+
+async def run(args, traces: list) -> dict:
+    from app import metrics
+
+    if args.url:
+        client = HTTPClient(args.url, args.concurrency)
+    else:
+        from app.main import app
+        from app.routers import chat
+        from app.utils.agent_tools.llm_backends import FakeBackend
+        from app.utils.agent_tools.llm_scheduler import LLMScheduler
+
+        chat.llm_backend = FakeBackend(latency_seconds = args.latency, jitter_seconds = args.jitter, seed = 0)
+        # A fresh scheduler, bound to this event loop
+        if args.no_limits:
+            unlimited = (10 ** 6, 10 ** 9)
+            chat.llm_scheduler = LLMScheduler({model: unlimited for model in
+                                               (chat.ROUTER_MODEL, chat.CODE_MODEL, chat.CHAT_MODEL_SETTINGS["model_name"])})
+        else:
+            chat.llm_scheduler = LLMScheduler()
+        client = InProcessClient(app)
+
+    queue = asyncio.Queue()
+    for trace in traces:
+        queue.put_nowait(trace)
+
+    results = []
+    lag_samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+    path = "/api/chat/stream" if args.stream else "/api/chat"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(student(client, path, queue, results, args.think)
+                           for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    await client.close()
+    return {"results": results, "elapsed": elapsed, "lag": lag_samples, "metrics": metrics.snapshot()}
+
+
+# ==============================================================================
+# Report
+# ==============================================================================
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def print_report(args, report: dict):
+    results = report["results"]
+    ok = [r for r in results if not r["failed"]]
+    latencies = [r["seconds"] for r in ok]
+    first_tokens = [r["first_token_seconds"] for r in ok if r["first_token_seconds"] is not None]
+    statuses = {}
+    for r in results:
+        if r["failed"]:
+            statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+
+    target = args.url or f"in-process, fake LLM {args.latency}s ± {args.jitter}s"
+    print(f"{'POST /api/chat/stream' if args.stream else 'POST /api/chat'} ({target}), "
+          f"{args.concurrency} concurrent students\n")
+    print(f"turns:       {len(results)} ({len(ok)} ok, {len(results) - len(ok)} failed{' by status ' + str(statuses) if statuses else ''})")
+    print(f"elapsed:     {report['elapsed']:.2f} s")
+    print(f"throughput:  {len(ok) / report['elapsed']:.1f} turns/s\n")
+
+    print(f"{'':>18} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'max':>8}")
+    print("-" * 62)
+    rows = [("turn latency (s)", latencies)]
+    if args.stream:
+        rows.append(("first token (s)", first_tokens))
+    rows.append(("loop lag (ms)", [lag * 1000 for lag in report["lag"]]))
+    for label, values in rows:
+        print(f"{label:>18} | {percentile(values, 0.5):>8.3f} | {percentile(values, 0.95):>8.3f} | "
+              f"{percentile(values, 0.99):>8.3f} | {max(values, default = float('nan')):>8.3f}")
+
+    if not args.url:
+        print("\nmetrics:")
+        for values in report["metrics"].values():
+            for name, value in sorted(values.items()):
+                if name.startswith(REPORTED_METRICS):
+                    print(f"  {name}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traces", help = "JSON or JSONL file with conversation traces")
+    parser.add_argument("--sessions", type = int, default = 100, help = "Number of traces to replay (default 100)")
+    parser.add_argument("--turns", type = int, default = 10, help = "User turns per synthetic session (default 10)")
+    parser.add_argument("--concurrency", type = int, default = 50, help = "Simulated students (default 50)")
+    parser.add_argument("--think", type = float, default = 0.0, help = "Seconds a student waits between turns")
+    parser.add_argument("--latency", type = float, default = 0.5, help = "Fake LLM latency per call in seconds (default 0.5)")
+    parser.add_argument("--jitter", type = float, default = 0.1, help = "Fake LLM latency jitter in seconds (default 0.1)")
+    parser.add_argument("--stream", action = "store_true", help = "Use /api/chat/stream and time the first token")
+    parser.add_argument("--no-limits", action = "store_true", help = "Lift the per-model limits of llm_scheduler")
+    parser.add_argument("--url", help = "Load a running server (e.g. http://localhost:8000) instead")
+    parser.add_argument("--problem-statement", default = "Write the game of Nimm.", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    traces = load_traces(args)
+    if not traces:
+        print("No traces to replay")
+        sys.exit(1)
+
+    report = asyncio.run(run(args, traces))
+    print_report(args, report)
+
+
+if __name__ == "__main__":
+    main()